@@ -0,0 +1,160 @@
+"""Admission control for workflow requests.
+
+At most max_concurrent workflows run at once per worker; the rest wait in a
+bounded queue. Waiters are served strictly by priority class and round-robin
+across clients within a class, so one chatty client cannot starve the others.
+When the queue (or a client's share of it) is full, or a waiter times out,
+the request is rejected immediately with a Retry-After estimate instead of
+piling onto the same API quota.
+"""
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional
+
+PRIORITIES = ("high", "normal", "low")
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, client_id: str, priority: str):
+        self.client_id = client_id
+        self.priority = priority
+        self.enqueued = time.perf_counter()
+        self.event = threading.Event()
+        self.admitted = False
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 32,
+                 max_per_client: int = 8, queue_timeout: float = 30.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.queue_timeout = queue_timeout
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._queued = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._avg_service = 5.0
+        self._recent_waits: Deque[float] = deque(maxlen=200)
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "4")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+            max_per_client=int(os.getenv("ADMISSION_MAX_PER_CLIENT", "8")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30")),
+        )
+
+    @contextmanager
+    def admit(self, client_id: str, priority: str = "normal"):
+        """Hold a workflow slot for the duration of the block, or raise AdmissionRejected"""
+        if priority not in PRIORITIES:
+            priority = "normal"
+        self._acquire(client_id, priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - start)
+
+    def _acquire(self, client_id: str, priority: str):
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._queued:
+                self._in_flight += 1
+                self.admitted += 1
+                self._recent_waits.append(0.0)
+                return
+            client_queue = self._queues[priority].get(client_id)
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected("queue full", self._retry_after())
+            if self._client_queued(client_id) >= self.max_per_client:
+                self.rejected += 1
+                raise AdmissionRejected("too many queued requests for this client", self._retry_after())
+            waiter = _Waiter(client_id, priority)
+            if client_queue is None:
+                client_queue = self._queues[priority][client_id] = deque()
+            client_queue.append(waiter)
+            self._queued += 1
+
+        if waiter.event.wait(self.queue_timeout):
+            return
+        with self._lock:
+            if waiter.admitted:
+                return  # Admitted just as the wait timed out
+            client_queue = self._queues[priority].get(client_id)
+            if client_queue is not None and waiter in client_queue:
+                client_queue.remove(waiter)
+                if not client_queue:
+                    del self._queues[priority][client_id]
+                self._queued -= 1
+            self.timeouts += 1
+            self.rejected += 1
+            raise AdmissionRejected("timed out waiting in queue", self._retry_after())
+
+    def _release(self, service_time: float):
+        with self._lock:
+            self._in_flight -= 1
+            self._avg_service += 0.2 * (service_time - self._avg_service)
+            while self._in_flight < self.max_concurrent and self._queued:
+                waiter = self._next_waiter()
+                waiter.admitted = True
+                self._in_flight += 1
+                self.admitted += 1
+                self._recent_waits.append(time.perf_counter() - waiter.enqueued)
+                waiter.event.set()
+
+    def _next_waiter(self) -> _Waiter:
+        """Highest priority class first; round-robin across clients within it"""
+        for priority in PRIORITIES:
+            clients = self._queues[priority]
+            if clients:
+                client_id, client_queue = next(iter(clients.items()))
+                waiter = client_queue.popleft()
+                if client_queue:
+                    clients.move_to_end(client_id)
+                else:
+                    del clients[client_id]
+                self._queued -= 1
+                return waiter
+        raise RuntimeError("admission queue accounting is inconsistent")
+
+    def _client_queued(self, client_id: str) -> int:
+        return sum(len(clients.get(client_id, ())) for clients in self._queues.values())
+
+    def _retry_after(self) -> float:
+        # Time for the current queue to drain through the available slots
+        return max(1.0, math.ceil((self._queued + 1) / self.max_concurrent * self._avg_service))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            p95: Optional[float] = waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else None
+            return {
+                "in_flight": self._in_flight,
+                "queue_depth": self._queued,
+                "queue_depth_by_priority": {p: sum(len(q) for q in self._queues[p].values()) for p in PRIORITIES},
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else None,
+                "p95_wait_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "avg_service_s": round(self._avg_service, 3),
+            }
@@ -1,4 +1,5 @@
 import os
+import re
 import json
 import time
 from dataclasses import dataclass, field
@@ -7,6 +8,14 @@ from enum import Enum
 from langgraph.graph import StateGraph, END
 import google.generativeai as genai
 from dotenv import load_dotenv
+from document_index import retrieve_context
+from work_queue import get_work_queue, submit, is_queued, collect
+from llm_recording import InteractionRecorder, ReplayBackend
+from workflow_budget import BudgetController, COMPLETED, FAST_PATH, INCOMPLETE, MAX_ITERATIONS
+from plan_sizing import choose_plan_size, node_timings
+from singleflight import SingleFlight
+from aggregator import ResultAggregator, bounded
+from dedup import SubtaskDeduplicator
 
 load_dotenv()
 
@@ -31,6 +40,10 @@ class SubTask:
     tools: List[str] = field(default_factory=lambda: ["web_search"])
     attempts: int = 0
     max_attempts: int = 3
+    retries: int = 0
+    sources: List[str] = field(default_factory=list)
+    critique: str = ""
+    accepted_result: str = ""
 
 @dataclass
 class TaskFeedback:
@@ -50,13 +63,37 @@ class WorkflowState:
     feedback_queue: List[TaskFeedback] = field(default_factory=list)
     workflow_complete: bool = False
     final_result: str = ""
+    llm_calls: int = 0
+    llm_cost: float = 0.0
+    last_progress_signature: str = ""
+    stalled_iterations: int = 0
+    stop_reason: str = ""
+    latency_budget: float = 0.0
+    cost_budget: float = 0.0
+    complexity: float = 0.0
+    max_parallelism: int = 1
+    fast_path: bool = False
+    queued_items: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    run_id: str = ""
+    summary_entries: Dict[str, str] = field(default_factory=dict)
+    deadline: float = 0.0
+    dedup_audit: List[Dict] = field(default_factory=list)
 
 class GeminiClient:
     def __init__(self):
         self.api_key = os.getenv("GOOGLE_API_KEY")
         self.available = False
+        # Identical prompts already in flight share one API call
+        self._inflight = SingleFlight("llm", os.getenv("SINGLEFLIGHT_LOCK_DIR"))
         
-        if self.api_key and not self.api_key.startswith("YOUR_"):
+        # Optional prompt/response recording and offline replay for load testing
+        self.recorder = InteractionRecorder.from_env()
+        self.replay = ReplayBackend.from_env()
+        
+        if self.replay:
+            self.available = True
+            print(f"🔁 Replaying LLM responses from {self.replay.path}")
+        elif self.api_key and not self.api_key.startswith("YOUR_"):
             try:
                 genai.configure(api_key=self.api_key)
                 self.model = genai.GenerativeModel("gemini-1.5-flash-latest")
@@ -72,12 +109,34 @@ class GeminiClient:
             return self._fallback_response(prompt)
         
         try:
-            response = self.model.generate_content(prompt)
-            return response.text if response and response.text else ""
+            start = time.perf_counter()
+            text, shared = self._inflight.do(prompt, lambda: self._call_model(prompt))
+            if shared and self.recorder:
+                # Joined an identical in-flight call, so _call_model never saw this prompt
+                self.recorder.record(prompt, text, time.perf_counter() - start, coalesced=True)
+            return text
         except Exception as e:
             print(f"API error: {e}")
             return self._fallback_response(prompt)
     
+    def _call_model(self, prompt: str) -> str:
+        start = time.perf_counter()
+        try:
+            if self.replay:
+                text = self.replay.generate(prompt)
+                if text is None:
+                    text = self._fallback_response(prompt)
+            else:
+                response = self.model.generate_content(prompt)
+                text = response.text if response and response.text else ""
+        except Exception as e:
+            if self.recorder:
+                self.recorder.record(prompt, None, time.perf_counter() - start, error=str(e))
+            raise
+        if self.recorder:
+            self.recorder.record(prompt, text, time.perf_counter() - start)
+        return text
+    
     def _fallback_response(self, prompt: str) -> str:
         if "break down" in prompt.lower():
             return json.dumps([
@@ -93,6 +152,14 @@ class GeminiClient:
 
 # Initialize global client
 gemini = GeminiClient()
+budget = BudgetController()
+dedup = SubtaskDeduplicator()
+SUMMARY_MAX_ENTRY_CHARS = int(os.getenv("SUMMARY_MAX_ENTRY_CHARS", "2000"))
+CRITIQUE_MAX_CHARS = int(os.getenv("CRITIQUE_MAX_CHARS", "500"))
+# Only this explicit verdict line triggers a patch retry; wording elsewhere in a reflection does not
+PATCH_VERDICT_RE = re.compile(r"^\W*VERDICT:\s*PATCH\b\W*(.*)$", re.IGNORECASE | re.MULTILINE)
+aggregator = ResultAggregator(
+    format_entry=lambda t: f"✅ {t.description}\n   → {bounded(t.result, SUMMARY_MAX_ENTRY_CHARS)}")
 
 class PlanAgent:
     def __call__(self, state: WorkflowState) -> WorkflowState:
@@ -100,31 +167,59 @@ class PlanAgent:
         state.outer_iteration += 1
         
         if state.outer_iteration > 5:
-            state.workflow_complete = True
+            budget.stop(state, MAX_ITERATIONS)
+            return state
+        
+        # Stop as soon as an iteration changes nothing since the last one
+        if not budget.check_progress(state):
             return state
         
         # Process feedback first
         if state.feedback_queue:
             state = self._process_feedback(state)
         
-        # Create initial tasks if none exist
+        # Create initial tasks if none exist, sized to the query and its budget
         if not state.subtasks:
-            state = self._create_subtasks(state)
+            sizing = choose_plan_size(state.user_query, state.latency_budget, state.cost_budget,
+                                      budget.avg_call_cost, calls_per_task=2)
+            state.complexity, state.max_parallelism = sizing.complexity, sizing.max_parallelism
+            if sizing.fast_path:
+                return self._answer_directly(state, sizing.reason)
+            state = self._create_subtasks(state, sizing.subtasks)
         
         # Check completion
-        state.workflow_complete = self._all_completed(state)
+        state.workflow_complete = state.workflow_complete or self._all_completed(state)
         return state
     
-    def _create_subtasks(self, state: WorkflowState) -> WorkflowState:
+    def _answer_directly(self, state: WorkflowState, reason: str) -> WorkflowState:
+        """Single-call fast path: no planning, dispatch or reflection"""
+        print(f"⚡ Fast path ({reason})")
+        state.fast_path = True
+        
+        prompt = f"""Answer this request directly:
+        "{state.user_query}"
+        
+        Respond with the answer only."""
+        
+        answer = budget.generate(state, gemini, prompt)
+        if answer is not None:
+            state.final_result = answer or "❌ No answer generated"
+            state.stop_reason = FAST_PATH
+        return state
+    
+    def _create_subtasks(self, state: WorkflowState, max_subtasks: int = 5) -> WorkflowState:
         print("📋 Creating subtasks...")
         
-        prompt = f"""Break down this request into 3-5 actionable subtasks:
+        size = f"{max_subtasks - 1}-{max_subtasks}" if max_subtasks > 1 else "1"
+        prompt = f"""Break down this request into {size} actionable subtasks:
         "{state.user_query}"
         
         Return JSON array:
         [{{"description": "task description", "agent_type": "research_agent|analysis_agent|creative_agent|technical_agent"}}]"""
         
-        response = gemini.generate(prompt)
+        response = budget.generate(state, gemini, prompt)
+        if response is None:
+            return state  # The budget stopped the run; do not plan work that will never run
         
         try:
             # Extract JSON from response
@@ -143,13 +238,15 @@ class PlanAgent:
             ]
         
         # Create SubTask objects
-        for i, task_data in enumerate(tasks_data):
-            task_id = f"task_{i+1}"
+        for task_data in tasks_data[:max_subtasks]:
+            task_id = f"task_{len(state.subtasks) + 1}"
             subtask = SubTask(
                 id=task_id,
                 description=task_data["description"],
                 agent_type=task_data.get("agent_type", "research_agent")
             )
+            if dedup.merge_duplicate(state, subtask.description, subtask.agent_type, "plan"):
+                continue
             state.subtasks[task_id] = subtask
             state.task_order.append(task_id)
         
@@ -163,12 +260,28 @@ class PlanAgent:
             if feedback.feedback_type == FeedbackType.MODIFY:
                 if feedback.task_id in state.subtasks:
                     task = state.subtasks[feedback.task_id]
-                    task.description += f" (Updated: {feedback.message})"
+                    # Retries survive outer iterations so a task cannot be retried indefinitely
+                    task.retries += 1
+                    aggregator.discard(state, task.id)
+                    dedup.forget(state, task)
+                    if task.retries > task.max_attempts:
+                        task.status = TaskStatus.FAILED
+                        continue
+                    if os.getenv("INCREMENTAL_RETRIES", "1") == "1":
+                        # Keep what was already produced; the retry only patches it
+                        if task.status == TaskStatus.COMPLETED and task.result:
+                            task.accepted_result = task.result
+                        task.critique = feedback.message
+                    else:
+                        note = f" (Updated: {feedback.message})"
+                        if note not in task.description:
+                            task.description += note
                     task.status = TaskStatus.PENDING
                     task.attempts = 0
             
             elif feedback.feedback_type == FeedbackType.DELETE:
                 if feedback.task_id in state.subtasks:
+                    aggregator.discard(state, feedback.task_id)
                     del state.subtasks[feedback.task_id]
                     if feedback.task_id in state.task_order:
                         state.task_order.remove(feedback.task_id)
@@ -176,7 +289,10 @@ class PlanAgent:
             elif feedback.feedback_type == FeedbackType.ADD:
                 for new_task in feedback.new_tasks:
                     task_id = f"task_{len(state.subtasks) + 1}"
-                    state.subtasks[task_id] = SubTask(id=task_id, description=new_task)
+                    subtask = SubTask(id=task_id, description=new_task)
+                    if dedup.merge_duplicate(state, new_task, subtask.agent_type, f"add:{feedback.task_id}"):
+                        continue
+                    state.subtasks[task_id] = subtask
                     state.task_order.append(task_id)
         
         state.feedback_queue.clear()
@@ -229,20 +345,106 @@ class ToolAgent:
         
         print(f"⚙️ Executing {task.id} (attempt {task.attempts})")
         
-        # Execute task
-        prompt = f"""Execute this task:
-        Task: {task.description}
-        Agent: {task.agent_type}
-        Tools: {', '.join(task.tools)}
+        if dedup.reuse(state, task):
+            task.status = TaskStatus.COMPLETED
+            aggregator.record(state, task)
+            return state
         
-        Provide detailed execution result."""
+        prompt = self._build_prompt(state, task)
+        queue = get_work_queue()
+        if queue:
+            result = self._execute_queued(state, task, prompt, queue)
+        else:
+            result = budget.generate(state, gemini, prompt)
+        if result is None:
+            # Out of budget: leave the task untouched for the final report
+            task.attempts -= 1
+            task.status = TaskStatus.PENDING
+            return state
+        if result and task.accepted_result:
+            result = self._apply_patch(task, result)
+        if result:
+            task.critique = ""  # Consumed by this attempt; later prompts must not repeat it
         
-        result = gemini.generate(prompt)
         task.result = result or f"Executed using {', '.join(task.tools[:2])}"
         task.status = TaskStatus.COMPLETED if result else TaskStatus.FAILED
+        if task.status == TaskStatus.COMPLETED:
+            aggregator.record(state, task)
+            dedup.remember(state, task)
+        else:
+            aggregator.discard(state, task.id)
         
         print(f"📊 Result: {task.result[:60]}...")
         return state
+    
+    def _build_prompt(self, state: WorkflowState, task: SubTask) -> str:
+        # Ground web_search/document_analysis in the local corpus when one is indexed
+        context, task.sources = retrieve_context(f"{task.description} {state.user_query}", task.tools)
+        reference = f"\n        Reference passages from the local corpus:\n{context}\n" if context else ""
+        critique = f"\n        Feedback on the previous attempt: {task.critique}" if task.critique else ""
+        
+        if task.accepted_result and task.critique:
+            return f"""Improve the previous result of this task according to the critique:
+        Task: {task.description}
+        Agent: {task.agent_type}
+        {reference}
+        Previous result:
+{task.accepted_result}
+
+        Critique: {task.critique}
+        
+        Do not repeat the previous result. Reply only with the missing or corrected content,
+        written so it can be appended to the previous result. If the previous result is
+        unusable, start your reply with "REWRITE:" followed by a complete replacement."""
+        
+        return f"""Execute this task:
+        Task: {task.description}
+        Agent: {task.agent_type}
+        Tools: {', '.join(task.tools)}{critique}
+        {reference}
+        Provide detailed execution result."""
+    
+    def _apply_patch(self, task: SubTask, patch: str) -> str:
+        """Combine the accepted result with a retry's continuation (or its full rewrite)"""
+        patch = patch.strip()
+        if patch.startswith("REWRITE:"):
+            merged = patch[len("REWRITE:"):].strip()
+        else:
+            merged = f"{task.accepted_result}\n\n{patch}"
+        task.accepted_result = ""
+        return merged
+    
+    def _execute_queued(self, state: WorkflowState, task: SubTask, prompt: str, queue) -> Optional[str]:
+        """Run through the shared work queue; None only when the budget refused the call"""
+        if not is_queued(state, task, prompt):
+            if not budget.reserve(state, prompt):
+                return None
+            submit(queue, state, task, prompt)
+        self._prefetch(state, queue)
+        result = collect(queue, state, task.id)
+        if result is None:
+            return ""
+        budget.settle(state, prompt, result)
+        return result
+    
+    def _prefetch(self, state: WorkflowState, queue):
+        """Publish upcoming pending tasks so idle workers run them while this one executes"""
+        for task_id in list(state.queued_items):
+            if task_id not in state.subtasks or state.subtasks[task_id].status == TaskStatus.COMPLETED:
+                del state.queued_items[task_id]
+        for task_id in state.task_order:
+            if len(state.queued_items) >= state.max_parallelism or not budget.has_budget(state):
+                return
+            upcoming = state.subtasks.get(task_id)
+            if upcoming is None or upcoming.status != TaskStatus.PENDING or task_id in state.queued_items:
+                continue
+            if not upcoming.retries and dedup.lookup(upcoming, state.user_query):
+                continue  # Will be served from a stored result
+            # Same tools AgentDispatch will assign when the task is selected
+            upcoming.tools = AgentDispatch.CAPABILITIES.get(upcoming.agent_type, ["web_search"])
+            prompt = self._build_prompt(state, upcoming)
+            budget.reserve(state, prompt)
+            submit(queue, state, upcoming, prompt)
 
 class ReflectionAgent:
     def __call__(self, state: WorkflowState) -> WorkflowState:
@@ -258,9 +460,13 @@ class ReflectionAgent:
         Result: {task.result}
         Status: {task.status.value}
         
-        Evaluate quality and suggest improvements."""
+        Evaluate quality and suggest improvements.
+        End with one line: "VERDICT: ACCEPT", or "VERDICT: PATCH: <what is missing or wrong>"
+        if the result is usable but must be completed before it can be accepted."""
         
-        reflection = gemini.generate(prompt)
+        reflection = budget.generate(state, gemini, prompt)
+        if reflection is None:
+            return state
         
         # Create feedback if needed
         feedback = self._generate_feedback(task, reflection)
@@ -285,6 +491,16 @@ class ReflectionAgent:
                     message="Task failed multiple times"
                 )
         
+        # A usable but incomplete result is patched on retry rather than redone
+        verdict = PATCH_VERDICT_RE.search(reflection)
+        if verdict and task.retries < task.max_attempts:
+            critique = verdict.group(1).strip() or reflection[:verdict.start()]
+            return TaskFeedback(
+                task_id=task.id,
+                feedback_type=FeedbackType.MODIFY,
+                message=bounded(" ".join(critique.split()), CRITIQUE_MAX_CHARS)
+            )
+        
         if "additional" in reflection.lower():
             return TaskFeedback(
                 task_id=task.id,
@@ -299,19 +515,24 @@ def finalize_results(state: WorkflowState) -> WorkflowState:
     """Compile final results"""
     print("\n📋 Finalizing results...")
     
-    completed = [t for t in state.subtasks.values() if t.status == TaskStatus.COMPLETED]
+    if state.fast_path and state.final_result:
+        aggregator.finish(state)
+        return state
     
-    if completed:
-        results = [f"✅ {t.description}\n   → {t.result}" for t in completed]
-        state.final_result = "\n\n".join(results)
-    else:
-        state.final_result = "❌ No tasks completed successfully"
+    # Entries were formatted as tasks completed; only the optional synthesis remains
+    synthesis = None
+    if os.getenv("FINALIZE_SYNTHESIS") == "1" and state.summary_entries:
+        synthesis = budget.generate(state, gemini, aggregator.synthesis_prompt(state))
     
+    if not state.stop_reason:
+        completed = sum(1 for t in state.subtasks.values() if t.status == TaskStatus.COMPLETED)
+        state.stop_reason = COMPLETED if completed == len(state.subtasks) else INCOMPLETE
+    aggregator.finish(state, synthesis)
     return state
 
 # Routing functions
 def route_workflow(state: WorkflowState) -> str:
-    if state.workflow_complete:
+    if state.workflow_complete or state.stop_reason:
         return "finalize"
     
     pending = [t for t in state.subtasks.values() 
@@ -320,6 +541,8 @@ def route_workflow(state: WorkflowState) -> str:
     return "task_selector" if pending and not state.feedback_queue else "plan"
 
 def route_task_selector(state: WorkflowState) -> str:
+    if state.stop_reason:
+        return "finalize"
     if state.current_task_id:
         return "agent_dispatch"
     
@@ -327,6 +550,8 @@ def route_task_selector(state: WorkflowState) -> str:
     return "finalize" if all_done else "plan"
 
 def route_after_reflection(state: WorkflowState) -> str:
+    if state.stop_reason:
+        return "finalize"
     if state.current_task_id:
         task = state.subtasks[state.current_task_id]
         if task.status == TaskStatus.FAILED and task.attempts < task.max_attempts:
@@ -335,6 +560,8 @@ def route_after_reflection(state: WorkflowState) -> str:
     pending = [t for t in state.subtasks.values() if t.status == TaskStatus.PENDING]
     if pending:
         return "task_selector"
+    if state.feedback_queue:
+        return "plan"  # Apply feedback gathered while the plan ran before finalizing
     
     all_done = all(t.status == TaskStatus.COMPLETED for t in state.subtasks.values())
     return "finalize" if all_done else "plan"
@@ -346,12 +573,12 @@ def create_workflow() -> StateGraph:
     workflow = StateGraph(WorkflowState)
     
     # Add nodes
-    workflow.add_node("plan", PlanAgent())
-    workflow.add_node("task_selector", select_next_task)
-    workflow.add_node("agent_dispatch", AgentDispatch())
-    workflow.add_node("tool_agent", ToolAgent())
-    workflow.add_node("reflection", ReflectionAgent())
-    workflow.add_node("finalize", finalize_results)
+    workflow.add_node("plan", node_timings.timed("plan", PlanAgent()))
+    workflow.add_node("task_selector", node_timings.timed("task_selector", select_next_task))
+    workflow.add_node("agent_dispatch", node_timings.timed("agent_dispatch", AgentDispatch()))
+    workflow.add_node("tool_agent", node_timings.timed("tool_agent", ToolAgent()))
+    workflow.add_node("reflection", node_timings.timed("reflection", ReflectionAgent()))
+    workflow.add_node("finalize", node_timings.timed("finalize", finalize_results))
     
     # Set entry point
     workflow.set_entry_point("plan")
@@ -388,12 +615,27 @@ def main():
     
     try:
         app = create_workflow()
-        initial_state = WorkflowState(user_query=query)
+        initial_state = WorkflowState(
+            user_query=query,
+            latency_budget=float(os.getenv("WORKFLOW_LATENCY_BUDGET", "0")),
+            cost_budget=float(os.getenv("WORKFLOW_COST_BUDGET", "0"))
+        )
+        timeout = float(os.getenv("WORKFLOW_TIMEOUT_SECONDS", "0"))
+        if timeout:
+            initial_state.deadline = time.time() + timeout
         
         print(f"\n🎯 Processing: {query}")
         print("=" * 50)
         
-        final_state = app.invoke(initial_state, config={"recursion_limit": 100})
+        arrival, started = time.time(), time.perf_counter()
+        try:
+            final_state = app.invoke(initial_state, config={"recursion_limit": 100})
+        except Exception:
+            if gemini.recorder:
+                gemini.recorder.record_request(query, time.perf_counter() - started, "error", arrival)
+            raise
+        if gemini.recorder:
+            gemini.recorder.record_request(query, time.perf_counter() - started, "ok", arrival)
         
         # Display results
         print("\n" + "=" * 50)
@@ -412,6 +654,8 @@ def main():
                 if task.result:
                     preview = task.result[:60] + "..." if len(task.result) > 60 else task.result
                     print(f"      → {preview}")
+                if task.sources:
+                    print(f"      📚 Sources: {', '.join(task.sources)}")
         
         if final_state.get('final_result'):
             print(f"\n🎯 FINAL RESULT:")
@@ -428,6 +672,12 @@ def main():
         print(f"   🔁 Inner iterations: {final_state.get('inner_iteration', 0)}")
         print(f"   ✅ Completed: {completed}/{total}")
         print(f"   🎯 Status: {'Complete' if final_state.get('workflow_complete') else 'Incomplete'}")
+        print(f"   🛑 Stop reason: {final_state.get('stop_reason', '')}")
+        print(f"   🤖 LLM calls: {final_state.get('llm_calls', 0)} (est. cost ${final_state.get('llm_cost', 0.0):.4f})")
+        audit = final_state.get('dedup_audit', [])
+        if audit:
+            reused = sum(1 for entry in audit if entry['action'] == 'reused')
+            print(f"   ♻️ Dedup: {len(audit) - reused} merged, {reused} reused")
         
     except Exception as e:
         print(f"\n❌ Error: {e}")
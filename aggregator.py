@@ -0,0 +1,174 @@
+"""Incremental final-result aggregation.
+
+Instead of scanning every subtask once the workflow ends, the ToolAgent hands
+each completed task to a ResultAggregator, which formats that one entry
+(bounded in size) and refreshes WorkflowState.final_result. The summary is
+therefore current after every task: finalize has nothing left to build, and a
+run that stops early (budget, timeout, error) still has a partial answer.
+
+Summaries of runs in progress are also published to `live_runs` so the web
+app can serve them while the workflow is still executing. Requests that join
+an identical in-flight workflow watch the leader's run under their own run id
+(a request still waiting for its run to start reads as queued), and with
+SHARED_CACHE_PATH set every worker on the host sees every run.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from shared_cache import get_shared_cache
+
+MAX_LIVE_RUNS = 200
+LIVE_RUN_TTL_SECONDS = 600
+SYNTHESIS_INPUT_CHARS = int(os.getenv("SYNTHESIS_INPUT_CHARS", "600"))
+SYNTHESIS_TOTAL_CHARS = int(os.getenv("SYNTHESIS_TOTAL_CHARS", "6000"))
+
+
+def bounded(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class LiveRuns:
+    """Latest partial summary of recent runs, keyed by run id"""
+
+    def __init__(self):
+        # (namespace, key) -> (expires, value); used when no shared cache is configured
+        self._local: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, namespace: str, key: str) -> Optional[Any]:
+        cache = get_shared_cache()
+        if cache:
+            return cache.get(f"live_runs.{namespace}", key)
+        with self._lock:
+            entry = self._local.get((namespace, key))
+            return entry[1] if entry and entry[0] > time.time() else None
+
+    def _set(self, namespace: str, key: str, value: Any):
+        cache = get_shared_cache()
+        if cache:
+            cache.set(f"live_runs.{namespace}", key, value, LIVE_RUN_TTL_SECONDS)
+            return
+        with self._lock:
+            self._local.pop((namespace, key), None)
+            self._local[(namespace, key)] = (time.time() + LIVE_RUN_TTL_SECONDS, value)
+            self._prune()
+
+    def start(self, run_id: str, query: str, group: str = ""):
+        """Register a run; group (the coalescing key) lets joined requests find it"""
+        self._set("run", run_id, {"run_id": run_id, "query": query, "summary": "", "completed": 0,
+                                  "total": 0, "done": False, "stop_reason": "", "updated": time.time()})
+        if group:
+            self._set("group", group, run_id)
+
+    def watch(self, run_id: str, group: str, leader: str = ""):
+        """Make run_id resolve to the run leading group (or to leader once known)"""
+        self._set("watch", run_id, {"group": group, "leader": leader, "since": time.time()})
+
+    def update(self, run_id: str, summary: str, completed: int, total: int):
+        run = self._get("run", run_id)
+        if run is not None:
+            run.update(summary=summary, completed=completed, total=total, updated=time.time())
+            self._set("run", run_id, run)
+
+    def finish(self, run_id: str, stop_reason: str):
+        run = self._get("run", run_id)
+        if run is not None:
+            run.update(done=True, stop_reason=stop_reason, updated=time.time(), finished=time.time())
+            self._set("run", run_id, run)
+
+    def forget(self, run_id: str):
+        """Drop a watch whose request never ran, e.g. one rejected by admission control"""
+        cache = get_shared_cache()
+        if cache:
+            cache.delete("live_runs.watch", run_id)
+            return
+        with self._lock:
+            self._local.pop(("watch", run_id), None)
+
+    def get(self, run_id: str) -> Optional[Dict]:
+        run = self._get("run", run_id)
+        if run is not None:
+            return dict(run)
+        watch = self._get("watch", run_id)
+        if watch is None:
+            return None
+        leader = watch["leader"] or self._get("group", watch["group"])
+        run = self._get("run", leader) if leader else None
+        # A finished run of the same query from before this request arrived is not the one it joined
+        if run is not None and (watch["leader"] or not run["done"] or run["finished"] >= watch["since"]):
+            return dict(run, run_id=run_id, leader_run_id=leader)
+        return {"run_id": run_id, "query": "", "summary": "", "completed": 0, "total": 0, "done": False,
+                "stop_reason": "", "queued": True, "updated": watch["since"]}
+
+    def _prune(self):
+        now = time.time()
+        while self._local:
+            oldest = next(iter(self._local.values()))
+            if len(self._local) <= MAX_LIVE_RUNS * 3 and oldest[0] > now:
+                break
+            self._local.popitem(last=False)
+
+
+live_runs = LiveRuns()
+
+
+class ResultAggregator:
+    def __init__(self, format_entry: Callable, header: Optional[Callable] = None,
+                 empty: str = "❌ No tasks completed successfully"):
+        self.format_entry = format_entry
+        self.header = header
+        self.empty = empty
+
+    def record(self, state, task):
+        """Add or replace a completed task's entry and refresh the summary"""
+        state.summary_entries[task.id] = self.format_entry(task)
+        self._render(state)
+
+    def discard(self, state, task_id: str):
+        """Drop a task's entry once it is deleted or sent back for another attempt"""
+        if state.summary_entries.pop(task_id, None) is not None:
+            self._render(state)
+
+    def _render(self, state):
+        entries = [state.summary_entries[t] for t in state.task_order if t in state.summary_entries]
+        if entries:
+            lines: List[str] = self.header(state) if self.header else []
+            state.final_result = "\n".join(lines + entries) if lines else "\n\n".join(entries)
+        else:
+            state.final_result = self.empty
+        if state.run_id:
+            live_runs.update(state.run_id, state.final_result, len(entries), len(state.subtasks))
+
+    def synthesis_prompt(self, state) -> str:
+        """Prompt for an optional LLM synthesis over size-bounded task results"""
+        parts, used = [], 0
+        for task_id in state.task_order:
+            task = state.subtasks.get(task_id)
+            if task is None or task_id not in state.summary_entries:
+                continue
+            part = f"- {task.description}: {bounded(task.result, SYNTHESIS_INPUT_CHARS)}"
+            if used + len(part) > SYNTHESIS_TOTAL_CHARS:
+                break
+            parts.append(part)
+            used += len(part)
+        results = "\n".join(parts)
+        return f"""Synthesize one coherent final answer to this request from the task results below:
+        "{state.user_query}"
+
+        Task results:
+{results}
+
+        Respond with the final answer only."""
+
+    def finish(self, state, synthesis: Optional[str] = None):
+        """Final render (joining already formatted entries) and mark the live run done"""
+        if not state.fast_path:
+            self._render(state)
+        if synthesis and state.summary_entries:
+            state.final_result = f"🧩 Synthesis:\n{synthesis}\n\n{state.final_result}"
+        if state.run_id:
+            live_runs.update(state.run_id, state.final_result, len(state.summary_entries), len(state.subtasks))
+            live_runs.finish(state.run_id, state.stop_reason)
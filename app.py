@@ -1,15 +1,28 @@
-from flask import Flask, request, jsonify, render_template, render_template_string
+from flask import Flask, request, jsonify, render_template, render_template_string, send_from_directory
 from flask_cors import CORS
 import os
 import json
+import re
 import time
+import uuid
 from datetime import datetime
 from dataclasses import dataclass, field, asdict
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from enum import Enum
 from langgraph.graph import StateGraph, END
 import google.generativeai as genai
 from dotenv import load_dotenv
+from document_index import retrieve_context
+from work_queue import get_work_queue, submit, is_queued, collect
+from llm_recording import InteractionRecorder, ReplayBackend, prompt_hash
+from workflow_budget import BudgetController, COMPLETED, FAST_PATH, INCOMPLETE, MAX_ITERATIONS
+from plan_sizing import choose_plan_size, node_timings
+from singleflight import SingleFlight, normalize_query
+from profiling import RequestProfiler, active_profiler
+from admission import AdmissionController, AdmissionRejected
+from aggregator import ResultAggregator, live_runs, bounded
+from dedup import SubtaskDeduplicator
+from shared_cache import get_shared_cache
 
 # Load environment variables
 load_dotenv()
@@ -39,6 +52,10 @@ class SubTask:
     tools: List[str] = field(default_factory=lambda: ["web_search"])
     attempts: int = 0
     max_attempts: int = 3
+    retries: int = 0
+    sources: List[str] = field(default_factory=list)
+    critique: str = ""
+    accepted_result: str = ""
 
 @dataclass
 class TaskFeedback:
@@ -58,15 +75,40 @@ class WorkflowState:
     feedback_queue: List[TaskFeedback] = field(default_factory=list)
     workflow_complete: bool = False
     final_result: str = ""
+    llm_calls: int = 0
+    llm_cost: float = 0.0
+    last_progress_signature: str = ""
+    stalled_iterations: int = 0
+    stop_reason: str = ""
+    latency_budget: float = 0.0
+    cost_budget: float = 0.0
+    complexity: float = 0.0
+    max_parallelism: int = 1
+    fast_path: bool = False
+    queued_items: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    run_id: str = ""
+    summary_entries: Dict[str, str] = field(default_factory=dict)
+    deadline: float = 0.0
+    dedup_audit: List[Dict] = field(default_factory=list)
 
 class GeminiClient:
     def __init__(self):
         self.api_key = os.getenv("GOOGLE_API_KEY")
         self.available = False
+        # Identical prompts already in flight share one API call
+        self._inflight = SingleFlight("llm", os.getenv("SINGLEFLIGHT_LOCK_DIR"))
         
-        if self.api_key and not self.api_key.startswith("YOUR_"):
+        # Optional prompt/response recording and offline replay for load testing
+        self.recorder = InteractionRecorder.from_env()
+        self.replay = ReplayBackend.from_env()
+        
+        if self.replay:
+            self.available = True
+            print(f"🔁 Replaying LLM responses from {self.replay.path}")
+        elif self.api_key and not self.api_key.startswith("YOUR_"):
             try:
-                genai.configure(api_key=self.api_key)
+                # GEMINI_TRANSPORT=rest avoids gRPC, which does not cooperate with gevent workers
+                genai.configure(api_key=self.api_key, transport=os.getenv("GEMINI_TRANSPORT") or None)
                 self.model = genai.GenerativeModel("gemini-1.5-flash-latest")
                 self.available = True
                 print("✅ Gemini API configured")
@@ -76,16 +118,58 @@ class GeminiClient:
             print("❌ Using fallback mode - Set GOOGLE_API_KEY in .env file")
     
     def generate(self, prompt: str) -> str:
+        profiler = active_profiler()
+        if profiler is not None:
+            with profiler.span("llm.generate", "llm", prompt_chars=len(prompt)):
+                return self._generate(prompt)
+        return self._generate(prompt)
+    
+    def _generate(self, prompt: str) -> str:
         if not self.available:
             return self._fallback_response(prompt)
         
+        # Responses already produced by any worker on this host are served from the shared cache
+        cache = get_shared_cache()
+        if cache and LLM_CACHE_TTL_SECONDS > 0:
+            start = time.perf_counter()
+            cached = cache.get("llm", prompt_hash(prompt))
+            if cached is not None:
+                if self.recorder:
+                    # Logged too, so a recording replays every prompt the workflow sent
+                    self.recorder.record(prompt, cached, time.perf_counter() - start, cached=True)
+                return cached
+        
         try:
-            response = self.model.generate_content(prompt)
-            return response.text if response and response.text else ""
+            start = time.perf_counter()
+            text, shared = self._inflight.do(prompt, lambda: self._call_model(prompt))
+            if shared and self.recorder:
+                # Joined an identical in-flight call, so _call_model never saw this prompt
+                self.recorder.record(prompt, text, time.perf_counter() - start, coalesced=True)
+            if cache and LLM_CACHE_TTL_SECONDS > 0 and text:
+                cache.set("llm", prompt_hash(prompt), text, LLM_CACHE_TTL_SECONDS)
+            return text
         except Exception as e:
             print(f"API error: {e}")
             return self._fallback_response(prompt)
     
+    def _call_model(self, prompt: str) -> str:
+        start = time.perf_counter()
+        try:
+            if self.replay:
+                text = self.replay.generate(prompt)
+                if text is None:
+                    text = self._fallback_response(prompt)
+            else:
+                response = self.model.generate_content(prompt)
+                text = response.text if response and response.text else ""
+        except Exception as e:
+            if self.recorder:
+                self.recorder.record(prompt, None, time.perf_counter() - start, error=str(e))
+            raise
+        if self.recorder:
+            self.recorder.record(prompt, text, time.perf_counter() - start)
+        return text
+    
     def _fallback_response(self, prompt: str) -> str:
         if "break down" in prompt.lower():
             return json.dumps([
@@ -99,8 +183,23 @@ class GeminiClient:
             return "Task completed with good quality results after reflection"
         return "Processed successfully with fallback system"
 
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "600"))
+
 # Initialize global client
 gemini = GeminiClient()
+budget = BudgetController()
+dedup = SubtaskDeduplicator()
+# Summary entries are built as tasks complete; each result is limited to 100 characters
+aggregator = ResultAggregator(
+    format_entry=lambda task: f"• {task.description}: {bounded(task.result, 100)}",
+    header=lambda state: [f"🎯 Query: {state.user_query}",
+                          f"📊 Completed {len(state.summary_entries)}/{len(state.subtasks)} tasks"],
+)
+
+def init_clients():
+    """Recreate the API client in a forked worker (gunicorn preload_app) instead of sharing the parent's"""
+    global gemini
+    gemini = GeminiClient()
 
 # Agent classes with streamlined output
 class PlanAgent:
@@ -109,28 +208,56 @@ class PlanAgent:
         state.outer_iteration += 1
         
         if state.outer_iteration > 5:
-            state.workflow_complete = True
+            budget.stop(state, MAX_ITERATIONS)
+            return state
+        
+        # Stop as soon as an iteration changes nothing since the last one
+        if not budget.check_progress(state):
             return state
         
         if state.feedback_queue:
             state = self._process_feedback(state)
         
         if not state.subtasks:
-            state = self._create_subtasks(state)
+            sizing = choose_plan_size(state.user_query, state.latency_budget, state.cost_budget,
+                                      budget.avg_call_cost, calls_per_task=1)
+            state.complexity, state.max_parallelism = sizing.complexity, sizing.max_parallelism
+            if sizing.fast_path:
+                return self._answer_directly(state, sizing.reason)
+            state = self._create_subtasks(state, sizing.subtasks)
+        
+        state.workflow_complete = state.workflow_complete or self._all_completed(state)
+        return state
+    
+    def _answer_directly(self, state: WorkflowState, reason: str) -> WorkflowState:
+        """Single-call fast path: no planning, dispatch or reflection"""
+        print(f"⚡ Fast path ({reason})")
+        state.fast_path = True
         
-        state.workflow_complete = self._all_completed(state)
+        prompt = f"""Answer this request directly and concisely (max 200 words):
+        "{state.user_query}"
+        
+        Respond with the answer only."""
+        
+        answer = budget.generate(state, gemini, prompt)
+        if answer is not None:
+            state.final_result = answer or "❌ No answer generated"
+            state.stop_reason = FAST_PATH
         return state
     
-    def _create_subtasks(self, state: WorkflowState) -> WorkflowState:
+    def _create_subtasks(self, state: WorkflowState, max_subtasks: int = 5) -> WorkflowState:
         print("📋 Creating subtasks...")
         
-        prompt = f"""Break down this request into 3-5 actionable subtasks:
+        size = f"{max_subtasks - 1}-{max_subtasks}" if max_subtasks > 1 else "1"
+        prompt = f"""Break down this request into {size} actionable subtasks:
         "{state.user_query}"
         
         Return JSON array:
         [{{"description": "task description", "agent_type": "research_agent|analysis_agent|creative_agent|technical_agent"}}]"""
         
-        response = gemini.generate(prompt)
+        response = budget.generate(state, gemini, prompt)
+        if response is None:
+            return state  # The budget stopped the run; do not plan work that will never run
         
         try:
             start = response.find('[')
@@ -146,13 +273,15 @@ class PlanAgent:
                 {"description": f"Generate comprehensive output for: {state.user_query}", "agent_type": "creative_agent"}
             ]
         
-        for i, task_data in enumerate(tasks_data):
-            task_id = f"task_{i+1}"
+        for task_data in tasks_data[:max_subtasks]:
+            task_id = f"task_{len(state.subtasks) + 1}"
             subtask = SubTask(
                 id=task_id,
                 description=task_data["description"],
                 agent_type=task_data.get("agent_type", "research_agent")
             )
+            if dedup.merge_duplicate(state, subtask.description, subtask.agent_type, "plan"):
+                continue
             state.subtasks[task_id] = subtask
             state.task_order.append(task_id)
         
@@ -166,12 +295,28 @@ class PlanAgent:
             if feedback.feedback_type == FeedbackType.MODIFY:
                 if feedback.task_id in state.subtasks:
                     task = state.subtasks[feedback.task_id]
-                    task.description += f" (Updated: {feedback.message})"
+                    # Retries survive outer iterations so a task cannot be retried indefinitely
+                    task.retries += 1
+                    aggregator.discard(state, task.id)
+                    dedup.forget(state, task)
+                    if task.retries > task.max_attempts:
+                        task.status = TaskStatus.FAILED
+                        continue
+                    if os.getenv("INCREMENTAL_RETRIES", "1") == "1":
+                        # Keep what was already produced; the retry only patches it
+                        if task.status == TaskStatus.COMPLETED and task.result:
+                            task.accepted_result = task.result
+                        task.critique = feedback.message
+                    else:
+                        note = f" (Updated: {feedback.message})"
+                        if note not in task.description:
+                            task.description += note
                     task.status = TaskStatus.PENDING
                     task.attempts = 0
             
             elif feedback.feedback_type == FeedbackType.DELETE:
                 if feedback.task_id in state.subtasks:
+                    aggregator.discard(state, feedback.task_id)
                     del state.subtasks[feedback.task_id]
                     if feedback.task_id in state.task_order:
                         state.task_order.remove(feedback.task_id)
@@ -179,7 +324,10 @@ class PlanAgent:
             elif feedback.feedback_type == FeedbackType.ADD:
                 for new_task in feedback.new_tasks:
                     task_id = f"task_{len(state.subtasks) + 1}"
-                    state.subtasks[task_id] = SubTask(id=task_id, description=new_task)
+                    subtask = SubTask(id=task_id, description=new_task)
+                    if dedup.merge_duplicate(state, new_task, subtask.agent_type, f"add:{feedback.task_id}"):
+                        continue
+                    state.subtasks[task_id] = subtask
                     state.task_order.append(task_id)
         
         state.feedback_queue.clear()
@@ -231,14 +379,28 @@ class ToolAgent:
         
         print(f"⚙️ Executing {task.id}")
         
-        prompt = f"""Execute this task and provide a concise summary (max 200 words):
-        Task: {task.description}
-        Agent: {task.agent_type}
-        Tools: {', '.join(task.tools)}
+        if dedup.reuse(state, task):
+            task.status = TaskStatus.COMPLETED
+            aggregator.record(state, task)
+            return state
         
-        Provide actionable results."""
+        prompt = self._build_prompt(state, task)
+        queue = get_work_queue()
+        if queue:
+            result = self._execute_queued(state, task, prompt, queue)
+        else:
+            result = budget.generate(state, gemini, prompt)
+        if result is None:
+            # Out of budget: leave the task untouched for the final report
+            task.attempts -= 1
+            task.status = TaskStatus.PENDING
+            return state
+        
+        if result and task.accepted_result:
+            result = self._apply_patch(task, result)
+        if result:
+            task.critique = ""  # Consumed by this attempt; later prompts must not repeat it
         
-        result = gemini.generate(prompt)
         # Truncate result to max 200 words for summary
         words = result.split() if result else []
         if len(words) > 200:
@@ -246,9 +408,82 @@ class ToolAgent:
         
         task.result = result or f"Executed using {', '.join(task.tools[:2])}"
         task.status = TaskStatus.COMPLETED if result else TaskStatus.FAILED
+        if task.status == TaskStatus.COMPLETED:
+            aggregator.record(state, task)
+            dedup.remember(state, task)
+        else:
+            aggregator.discard(state, task.id)
         
         print(f"✅ Completed {task.id}")
         return state
+    
+    def _build_prompt(self, state: WorkflowState, task: SubTask) -> str:
+        context, task.sources = retrieve_context(f"{task.description} {state.user_query}", task.tools)
+        reference = f"\n        Reference passages from the local corpus:\n{context}\n" if context else ""
+        critique = f"\n        Feedback on the previous attempt: {task.critique}" if task.critique else ""
+        
+        if task.accepted_result and task.critique:
+            return f"""Improve the previous result of this task according to the critique:
+        Task: {task.description}
+        Agent: {task.agent_type}
+        {reference}
+        Previous result:
+{task.accepted_result}
+
+        Critique: {task.critique}
+        
+        Do not repeat the previous result. Reply only with the missing or corrected content,
+        written so it can be appended to the previous result. If the previous result is
+        unusable, start your reply with "REWRITE:" followed by a complete replacement."""
+        
+        return f"""Execute this task and provide a concise summary (max 200 words):
+        Task: {task.description}
+        Agent: {task.agent_type}
+        Tools: {', '.join(task.tools)}{critique}
+        {reference}
+        Provide actionable results."""
+    
+    def _apply_patch(self, task: SubTask, patch: str) -> str:
+        """Combine the accepted result with a retry's continuation (or its full rewrite)"""
+        patch = patch.strip()
+        if patch.startswith("REWRITE:"):
+            merged = patch[len("REWRITE:"):].strip()
+        else:
+            merged = f"{task.accepted_result}\n\n{patch}"
+        task.accepted_result = ""
+        return merged
+    
+    def _execute_queued(self, state: WorkflowState, task: SubTask, prompt: str, queue) -> Optional[str]:
+        """Run through the shared work queue; None only when the budget refused the call"""
+        if not is_queued(state, task, prompt):
+            if not budget.reserve(state, prompt):
+                return None
+            submit(queue, state, task, prompt)
+        self._prefetch(state, queue)
+        result = collect(queue, state, task.id)
+        if result is None:
+            return ""
+        budget.settle(state, prompt, result)
+        return result
+    
+    def _prefetch(self, state: WorkflowState, queue):
+        """Publish upcoming pending tasks so idle workers run them while this one executes"""
+        for task_id in list(state.queued_items):
+            if task_id not in state.subtasks or state.subtasks[task_id].status == TaskStatus.COMPLETED:
+                del state.queued_items[task_id]
+        for task_id in state.task_order:
+            if len(state.queued_items) >= state.max_parallelism or not budget.has_budget(state):
+                return
+            upcoming = state.subtasks.get(task_id)
+            if upcoming is None or upcoming.status != TaskStatus.PENDING or task_id in state.queued_items:
+                continue
+            if not upcoming.retries and dedup.lookup(upcoming, state.user_query):
+                continue  # Will be served from a stored result
+            # Same tools AgentDispatch will assign when the task is selected
+            upcoming.tools = AgentDispatch.CAPABILITIES.get(upcoming.agent_type, ["web_search"])
+            prompt = self._build_prompt(state, upcoming)
+            budget.reserve(state, prompt)
+            submit(queue, state, upcoming, prompt)
 
 class ReflectionAgent:
     def __call__(self, state: WorkflowState) -> WorkflowState:
@@ -267,26 +502,24 @@ class ReflectionAgent:
 def finalize_results(state: WorkflowState) -> WorkflowState:
     print("\n📋 Finalizing results...")
     
-    completed = [t for t in state.subtasks.values() if t.status == TaskStatus.COMPLETED]
-    if completed:
-        # Create a concise summary instead of full output
-        summary_parts = []
-        summary_parts.append(f"🎯 Query: {state.user_query}")
-        summary_parts.append(f"📊 Completed {len(completed)}/{len(state.subtasks)} tasks")
-        
-        for task in completed:
-            # Limit each task result to 100 characters for summary
-            result_preview = task.result[:100] + "..." if len(task.result) > 100 else task.result
-            summary_parts.append(f"• {task.description}: {result_preview}")
-        
-        state.final_result = "\n".join(summary_parts)
-    else:
-        state.final_result = "❌ No tasks completed successfully"
+    if state.fast_path and state.final_result:
+        aggregator.finish(state)
+        return state
+    
+    # The summary was already assembled as tasks completed; only the optional synthesis remains
+    synthesis = None
+    if os.getenv("FINALIZE_SYNTHESIS") == "1" and state.summary_entries:
+        synthesis = budget.generate(state, gemini, aggregator.synthesis_prompt(state))
+    
+    if not state.stop_reason:
+        completed = sum(1 for t in state.subtasks.values() if t.status == TaskStatus.COMPLETED)
+        state.stop_reason = COMPLETED if completed == len(state.subtasks) else INCOMPLETE
+    aggregator.finish(state, synthesis)
     return state
 
 # Routing functions
 def route_workflow(state: WorkflowState) -> str:
-    if state.workflow_complete:
+    if state.workflow_complete or state.stop_reason:
         return "finalize"
     
     pending = [t for t in state.subtasks.values() 
@@ -295,6 +528,8 @@ def route_workflow(state: WorkflowState) -> str:
     return "task_selector" if pending and not state.feedback_queue else "plan"
 
 def route_task_selector(state: WorkflowState) -> str:
+    if state.stop_reason:
+        return "finalize"
     if state.current_task_id:
         return "agent_dispatch"
     
@@ -302,6 +537,8 @@ def route_task_selector(state: WorkflowState) -> str:
     return "finalize" if all_done else "plan"
 
 def route_after_reflection(state: WorkflowState) -> str:
+    if state.stop_reason:
+        return "finalize"
     if state.current_task_id:
         task = state.subtasks[state.current_task_id]
         if task.status == TaskStatus.FAILED and task.attempts < task.max_attempts:
@@ -314,17 +551,23 @@ def route_after_reflection(state: WorkflowState) -> str:
     all_done = all(t.status == TaskStatus.COMPLETED for t in state.subtasks.values())
     return "finalize" if all_done else "plan"
 
-def create_workflow() -> StateGraph:
+def create_workflow(profiler: Optional[RequestProfiler] = None) -> StateGraph:
     print("🔧 Creating workflow...")
     
     workflow = StateGraph(WorkflowState)
     
-    workflow.add_node("plan", PlanAgent())
-    workflow.add_node("task_selector", select_next_task)
-    workflow.add_node("agent_dispatch", AgentDispatch())
-    workflow.add_node("tool_agent", ToolAgent())
-    workflow.add_node("reflection", ReflectionAgent())
-    workflow.add_node("finalize", finalize_results)
+    nodes = {
+        "plan": PlanAgent(),
+        "task_selector": select_next_task,
+        "agent_dispatch": AgentDispatch(),
+        "tool_agent": ToolAgent(),
+        "reflection": ReflectionAgent(),
+        "finalize": finalize_results,
+    }
+    for name, node in nodes.items():
+        # Per-node timings feed plan sizing; profiling wrappers are only added for profiled requests
+        node = node_timings.timed(name, node)
+        workflow.add_node(name, profiler.wrap_node(name, node) if profiler else node)
     
     workflow.set_entry_point("plan")
     
@@ -348,8 +591,43 @@ def create_workflow() -> StateGraph:
     
     return workflow.compile()
 
-# In-memory storage for history
+# In-memory storage for history (shared by all workers when SHARED_CACHE_PATH is set)
 query_history = []
+HISTORY_LIMIT = 50
+
+def add_history(entry: Dict):
+    cache = get_shared_cache()
+    if cache:
+        cache.push("history", entry, HISTORY_LIMIT)
+        return
+    query_history.append(entry)
+    # Keep only last 50 entries
+    if len(query_history) > HISTORY_LIMIT:
+        query_history.pop(0)
+
+def load_history() -> List[Dict]:
+    cache = get_shared_cache()
+    return cache.items("history") if cache else list(query_history)
+
+def reset_history():
+    global query_history
+    cache = get_shared_cache()
+    if cache:
+        cache.clear("history")
+    query_history = []
+
+# Identical normalized queries already in flight share one workflow execution
+workflow_flight = SingleFlight("workflow", os.getenv("SINGLEFLIGHT_LOCK_DIR"))
+
+# Bounded, fair queue in front of workflow execution
+admission = AdmissionController.from_env()
+
+# Saved request profiles (Chrome trace JSON)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Wall-clock limit per workflow; once reached the run stops and returns what it has (0 = no limit)
+WORKFLOW_TIMEOUT_SECONDS = float(os.getenv("WORKFLOW_TIMEOUT_SECONDS", "0"))
+RUN_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
 
 def serialize_state(state_dict, include_full_results=False):
     """Convert state to JSON-serializable format with optional result truncation"""
@@ -372,7 +650,8 @@ def serialize_state(state_dict, include_full_results=False):
                     'agent_type': task.agent_type,
                     'tools': task.tools,
                     'attempts': task.attempts,
-                    'max_attempts': task.max_attempts
+                    'max_attempts': task.max_attempts,
+                    'sources': task.sources
                 }
                 result[key][task_id] = task_dict
         elif key == 'feedback_queue':
@@ -390,6 +669,67 @@ def serialize_state(state_dict, include_full_results=False):
     
     return result
 
+def run_workflow(query: str, profiler: Optional[RequestProfiler] = None,
+                 latency_budget: float = 0.0, cost_budget: float = 0.0,
+                 run_id: str = "", timeout: float = 0.0, group: str = "") -> dict:
+    """Run the workflow for a query and return its serialized final state"""
+    app_workflow = create_workflow(profiler)
+    run_id = run_id or uuid.uuid4().hex
+    live_runs.start(run_id, query, group)
+    initial_state = WorkflowState(user_query=query, latency_budget=latency_budget, cost_budget=cost_budget,
+                                  run_id=run_id, deadline=time.time() + timeout if timeout else 0.0)
+    
+    try:
+        if profiler is None:
+            final_state = app_workflow.invoke(initial_state, config={"recursion_limit": 100})
+        else:
+            with profiler.span("graph.invoke", "graph"):
+                final_state = app_workflow.invoke(initial_state, config={"recursion_limit": 100})
+    except Exception as e:
+        # Whatever was summarized before the failure is still worth returning
+        live_runs.finish(run_id, "error")
+        partial = live_runs.get(run_id)
+        if not partial or not partial["completed"]:
+            raise
+        print(f"⚠️ Workflow failed after {partial['completed']} tasks, returning partial result: {e}")
+        return {'user_query': query, 'final_result': partial['summary'], 'partial': True,
+                'stop_reason': 'error', 'run_id': run_id}
+    
+    # Serialize the state with summarized results
+    if profiler is None:
+        return serialize_state(final_state, include_full_results=False)
+    with profiler.span("serialize", "app"):
+        return serialize_state(final_state, include_full_results=False)
+
+def record_request(query: Optional[str], started: float, arrival: float, status: str):
+    """Add the request (including rejected and failed ones) to the LLM_RECORD_PATH log"""
+    if gemini.recorder and query:
+        gemini.recorder.record_request(query, time.perf_counter() - started, status, arrival)
+
+def profile_requested() -> Optional[str]:
+    """Profiling mode from ?profile= or the X-Profile header: '1' saves the trace, 'inline' also returns it"""
+    mode = request.args.get('profile') or request.headers.get('X-Profile')
+    if mode not in ('1', 'true', 'inline'):
+        return None
+    if not profile_token_ok():
+        return None
+    return mode
+
+def profile_token_ok() -> bool:
+    """Profiles contain query text and stack samples; with PROFILE_TOKEN set, require X-Profile-Token"""
+    token = os.getenv("PROFILE_TOKEN")
+    return not token or request.headers.get('X-Profile-Token') == token
+
+def admission_identity() -> Tuple[str, str]:
+    """Fairness key and priority class; X-Client-Id / X-Priority are only trusted from a proxy or with the token"""
+    token = os.getenv("ADMISSION_HEADER_TOKEN")
+    trusted = os.getenv("ADMISSION_TRUST_PROXY") == "1" or bool(
+        token and request.headers.get('X-Admission-Token') == token)
+    if not trusted:
+        return request.remote_addr or 'anonymous', 'normal'
+    client_id = request.headers.get('X-Client-Id') or request.remote_addr or 'anonymous'
+    return client_id, request.headers.get('X-Priority', 'normal').lower()
+
 # Flask Routes
 @app.route('/')
 def index():
@@ -399,6 +739,8 @@ def index():
 @app.route('/process', methods=['POST'])
 def process_query():
     """Process a user query through the workflow"""
+    query = None
+    arrival, started = time.time(), time.perf_counter()
     try:
         data = request.get_json()
         if not data or 'query' not in data:
@@ -408,17 +750,59 @@ def process_query():
         if not query:
             return jsonify({'error': 'Empty query provided'}), 400
         
-        print(f"\n🚀 Processing query: {query}")
-        
-        # Create and run workflow
-        app_workflow = create_workflow()
-        initial_state = WorkflowState(user_query=query)
+        # Optional per-request budgets (seconds / estimated cost) used to size the plan
+        try:
+            latency_budget = float(data.get('latency_budget') or 0)
+            cost_budget = float(data.get('cost_budget') or 0)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'latency_budget and cost_budget must be numbers'}), 400
+        if latency_budget < 0 or cost_budget < 0:
+            return jsonify({'error': 'Budgets must not be negative'}), 400
+        
+        # Optional client-chosen run id, so /progress/<run_id> can be polled while this request runs
+        run_id = str(data.get('run_id') or uuid.uuid4().hex)
+        if not RUN_ID_PATTERN.match(run_id):
+            return jsonify({'error': 'run_id must be 1-64 letters, digits, "-" or "_"'}), 400
+        timeout = WORKFLOW_TIMEOUT_SECONDS
         
-        # Execute workflow
-        final_state = app_workflow.invoke(initial_state, config={"recursion_limit": 100})
+        print(f"\n🚀 Processing query: {query}")
         
-        # Serialize the state with summarized results
-        serialized_state = serialize_state(final_state, include_full_results=False)
+        client_id, priority = admission_identity()
+        
+        profile_mode = profile_requested()
+        if profile_mode:
+            # Profiled requests always get their own execution so the trace is theirs
+            profiler = RequestProfiler(query)
+            with admission.admit(client_id, priority), profiler:
+                serialized_state = run_workflow(query, profiler, latency_budget, cost_budget, run_id, timeout)
+            profile_file = profiler.save(PROFILE_DIR)
+            profile_info = dict(profiler.summary(), file=profile_file, url=f"/profiles/{profile_file}")
+            if profile_mode == 'inline':
+                profile_info['trace'] = profiler.to_chrome_trace()
+            serialized_state = dict(serialized_state, profile=profile_info)
+            shared = False
+            print(f"⏱️ Profile saved to {os.path.join(PROFILE_DIR, profile_file)}")
+        else:
+            flight_key = f"{normalize_query(query)}|{latency_budget}|{cost_budget}"
+            
+            def admitted_run():
+                with admission.admit(client_id, priority):
+                    return run_workflow(query, None, latency_budget, cost_budget, run_id, timeout, flight_key)
+            
+            # Create and run workflow, joining an identical one if it is already running;
+            # only the request that actually runs it takes an admission slot.
+            # If this request joins, its run_id follows the leader's progress
+            live_runs.watch(run_id, flight_key)
+            try:
+                serialized_state, shared = workflow_flight.do(flight_key, admitted_run)
+            except AdmissionRejected:
+                live_runs.forget(run_id)
+                raise
+            if shared:
+                # Pin the run this request joined, so a later run of the same query does not replace it
+                live_runs.watch(run_id, flight_key, serialized_state.get('run_id', ''))
+                print("🔗 Joined in-flight workflow for identical query")
+            serialized_state = dict(serialized_state, run_id=run_id)
         
         # Store in history
         history_entry = {
@@ -427,28 +811,47 @@ def process_query():
             'result': serialized_state,
             'summary': serialized_state.get('final_result', 'No summary available')
         }
-        query_history.append(history_entry)
+        add_history(history_entry)
         
-        # Keep only last 50 entries
-        if len(query_history) > 50:
-            query_history.pop(0)
+        record_request(query, started, arrival, "ok")
         
         print("✅ Query processed successfully")
-        return jsonify(serialized_state)
+        return jsonify(dict(serialized_state, coalesced=shared))
         
+    except AdmissionRejected as e:
+        print(f"🚦 Rejected query: {e.reason}")
+        record_request(query, started, arrival, "rejected")
+        return jsonify({'error': f'Server busy ({e.reason}), please retry', 'retry_after': e.retry_after}), 429, \
+            {'Retry-After': str(int(e.retry_after))}
     except Exception as e:
         print(f"❌ Error processing query: {e}")
+        record_request(query, started, arrival, "error")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Processing failed: {str(e)}'}), 500
 
+@app.route('/progress/<run_id>', methods=['GET'])
+def get_progress(run_id):
+    """Partial summary of a running (or recently finished) workflow"""
+    run = live_runs.get(run_id)
+    if run is None:
+        return jsonify({'error': 'Unknown run_id'}), 404
+    return jsonify(run)
+
+@app.route('/profiles/<path:name>', methods=['GET'])
+def get_profile(name):
+    """Download a saved request profile (Chrome trace JSON, also opens in speedscope)"""
+    if not profile_token_ok():
+        return jsonify({'error': 'Invalid or missing X-Profile-Token'}), 403
+    return send_from_directory(os.path.abspath(PROFILE_DIR), name, mimetype='application/json')
+
 @app.route('/history', methods=['GET'])
 def get_history():
     """Get query history with summaries"""
     try:
         # Return only summaries for history view
         history_summary = []
-        for entry in query_history:
+        for entry in load_history():
             summary_entry = {
                 'timestamp': entry['timestamp'],
                 'query': entry['query'],
@@ -464,8 +867,7 @@ def get_history():
 def clear_history():
     """Clear query history"""
     try:
-        global query_history
-        query_history = []
+        reset_history()
         return jsonify({'message': 'History cleared successfully'})
     except Exception as e:
         print(f"❌ Error clearing history: {e}")
@@ -477,7 +879,14 @@ def get_status():
     return jsonify({
         'status': 'running',
         'gemini_available': gemini.available,
-        'total_queries': len(query_history),
+        'total_queries': len(load_history()),
+        'worker_pid': os.getpid(),
+        'in_flight_workflows': workflow_flight.in_flight(),
+        'node_timings': node_timings.snapshot(),
+        'admission': admission.stats(),
+        'work_queue': get_work_queue().stats() if get_work_queue() else None,
+        'dedup': dedup.stats(),
+        'shared_cache': get_shared_cache().stats() if get_shared_cache() else None,
         'timestamp': datetime.now().isoformat()
     })
 
@@ -494,13 +903,17 @@ if __name__ == '__main__':
     print("🚀 Starting Jashu Multi-Agents Workflow Server")
     print("=" * 50)
     print(f"🔑 Gemini API: {'✅ Configured' if gemini.available else '❌ Not configured'}")
-    print("🌐 Server starting on http://localhost:8000")
+    port = int(os.getenv("PORT", "8000"))
+    print(f"🌐 Development server starting on http://localhost:{port}")
+    print("   For production use: gunicorn -c gunicorn.conf.py")
     print("📡 API Endpoints:")
     print("   • GET  /          - Main interface")
     print("   • POST /process   - Process query")
     print("   • GET  /history   - Get history")
     print("   • POST /clear-history - Clear history")
     print("   • GET  /status    - System status")
+    print("   • GET  /profiles/<file> - Saved request profile")
+    print("   • GET  /progress/<run_id> - Partial summary of a running query")
     print("=" * 50)
 
     # Create .env file if it doesn't exist
@@ -509,4 +922,4 @@ if __name__ == '__main__':
             f.write('GOOGLE_API_KEY=YOUR_GOOGLE_API_KEY_HERE\n')
         print("📝 Created .env file - Please add your Google API key")
 
-    app.run(debug=True, host="0.0.0.0", port=8000)
\ No newline at end of file
+    app.run(debug=os.getenv("FLASK_DEBUG", "1") == "1", host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,13 @@
+"""ASGI entry point for uvicorn workers (WEB_WORKER_CLASS=uvicorn in gunicorn.conf.py).
+
+Requests are handed to a pool of WEB_THREADS threads, so one worker overlaps
+the blocking LLM calls of several requests while its event loop keeps
+accepting connections.
+"""
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from app import app as flask_app
+
+application = WSGIMiddleware(flask_app, workers=int(os.getenv("WEB_THREADS", "16")))
@@ -0,0 +1,84 @@
+"""Query latency of the local document index on a large synthetic corpus.
+
+Writes --docs small documents with a Zipf-like vocabulary, ingests them into
+a fresh index (optionally with the dense index) and reports ingest time plus
+p50/p95/max search latency over --queries random multi-term queries, after a
+warm-up, for BM25 alone and for BM25 + dense fusion.
+
+    python benchmarks/bench_document_index.py [--docs 200000] [--queries 200] [--dense]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_index import DocumentIndex  # noqa: E402
+
+VOCABULARY = 20000
+DOCS_PER_DIR = 1000
+
+
+def write_corpus(directory: str, docs: int, words_per_doc: int, rng: random.Random):
+    vocab = [f"w{i}" for i in range(VOCABULARY)]
+    weights = [1.0 / (rank + 1) for rank in range(VOCABULARY)]
+    for start in range(0, docs, DOCS_PER_DIR):
+        sub = os.path.join(directory, f"d{start // DOCS_PER_DIR:04d}")
+        os.makedirs(sub)
+        count = min(DOCS_PER_DIR, docs - start)
+        words = rng.choices(vocab, weights, k=count * words_per_doc)
+        for i in range(count):
+            with open(os.path.join(sub, f"{start + i}.txt"), "w", encoding="utf-8") as f:
+                f.write(" ".join(words[i * words_per_doc:(i + 1) * words_per_doc]))
+
+
+def measure(index: DocumentIndex, queries, k: int) -> dict:
+    for query in queries[:10]:
+        index.search(query, k)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+    return {"p50_ms": pct(0.5), "p95_ms": pct(0.95), "max_ms": pct(1.0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=200000)
+    parser.add_argument("--words", type=int, default=60, help="words per document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dense", action="store_true", help="also build and query the dense index")
+    parser.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as directory:
+        corpus, index_dir = os.path.join(directory, "corpus"), os.path.join(directory, "index")
+        start = time.perf_counter()
+        write_corpus(corpus, args.docs, args.words, rng)
+        print(f"corpus: {args.docs:,} documents written in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        DocumentIndex(index_dir, dense=args.dense).ingest(corpus)
+        print(f"ingest: {time.perf_counter() - start:.1f}s")
+
+        # Mid-frequency terms, as real queries mostly avoid the most common words
+        queries = [" ".join(f"w{rng.randint(20, 2000)}" for _ in range(rng.randint(2, 5)))
+                   for _ in range(args.queries)]
+        start = time.perf_counter()
+        index = DocumentIndex(index_dir, dense=False)
+        index.search("w1", args.k)
+        print(f"open + first query: {(time.perf_counter() - start) * 1000:.1f}ms")
+        print(f"bm25:         {measure(index, queries, args.k)}")
+        if args.dense:
+            print(f"bm25 + dense: {measure(DocumentIndex(index_dir, dense=True), queries, args.k)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Throughput of the production server as the gunicorn worker count grows.
+
+Starts `gunicorn -c gunicorn.conf.py` for each worker class and worker count,
+replays a burst of distinct workflow requests against it with
+llm_recording.loadtest and reports throughput and latency. LLM calls are
+served by the replay backend with a fixed latency, so the numbers reflect how
+well workers overlap I/O-bound calls rather than network variance. The LLM
+response cache and result reuse are disabled so every request does the full
+work, and the admission queue is sized so the whole burst is admitted.
+
+    python benchmarks/bench_server_scaling.py [--workers 1,2,4] [--classes sync,gthread,gevent]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from llm_recording import loadtest  # noqa: E402
+
+
+def write_log(path: str, requests: int, llm_latency: float):
+    with open(path, "w", encoding="utf-8") as f:
+        # A single recorded call sets the latency of every (unrecorded) replayed call
+        f.write(json.dumps({"kind": "llm", "ts": 0, "prompt_hash": "-", "prompt": "-",
+                            "response": "-", "latency": llm_latency, "error": None}) + "\n")
+        for i in range(requests):
+            query = f"Compare and analyze storage engines for service {i}, then design a migration plan"
+            f.write(json.dumps({"kind": "request", "ts": 0, "query": query, "latency": 0, "status": "ok"}) + "\n")
+
+
+def wait_ready(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/status", timeout=2) as resp:
+                return json.loads(resp.read())
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+
+def run(worker_class: str, workers: int, port: int, log_path: str, directory: str, requests: int) -> dict:
+    env = dict(os.environ, WEB_WORKER_CLASS=worker_class, WEB_CONCURRENCY=str(workers), PORT=str(port),
+               LLM_REPLAY_PATH=log_path, GOOGLE_API_KEY="", LLM_CACHE_TTL_SECONDS="0",
+               DEDUP_REUSE_THRESHOLD="0", ADMISSION_MAX_PER_CLIENT=str(requests), ADMISSION_MAX_QUEUE=str(requests),
+               SHARED_CACHE_PATH=os.path.join(directory, f"cache-{port}.db"))
+    env.pop("LLM_RECORD_PATH", None)
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base_url)
+        stats = loadtest(log_path, base_url)
+        # History written by every worker is visible from whichever one answers
+        stats["history"] = wait_ready(base_url)["total_queries"]
+        return stats
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--classes", default="sync,gthread")
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    port = args.port
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, "replay.jsonl")
+        write_log(log_path, args.requests, args.llm_latency)
+        print(f"{'class':>8} {'workers':>8} {'ok':>4} {'errors':>6} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'history':>8}")
+        for worker_class in args.classes.split(","):
+            for workers in (int(w) for w in args.workers.split(",")):
+                stats = run(worker_class, workers, port, log_path, directory, args.requests)
+                port += 1
+                print(f"{worker_class:>8} {workers:>8} {stats['ok']:>4} {stats['errors']:>6} {stats['throughput_rps']:>7} "
+                      f"{stats['p50_s']:>7} {stats['p95_s']:>7} {stats['history']:>8}")
+
+
+if __name__ == "__main__":
+    main()
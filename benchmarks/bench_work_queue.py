@@ -0,0 +1,91 @@
+"""Throughput benchmark for the subtask work queue.
+
+Measures publish rate, end-to-end drain throughput with 1/2/4 worker
+processes (zero-length items show pure queue overhead, short sleeps stand in
+for LLM-bound work) and recovery of items whose worker lost its lease.
+
+    python benchmarks/bench_work_queue.py [--items 400] [--work-seconds 0.05]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from work_queue import open_queue  # noqa: E402
+from worker import Worker  # noqa: E402
+
+
+def _run_worker(url: str, lease: float):
+    Worker(open_queue(url), concurrency=1, lease_seconds=lease, idle_exit=0.5).run()
+
+
+def _drain(url: str, workers: int, lease: float = 30.0) -> float:
+    start = time.perf_counter()
+    procs = [mp.Process(target=_run_worker, args=(url, lease)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    queue = open_queue(url)
+    while True:
+        stats = queue.stats()
+        if stats["pending"] == 0 and stats["leased"] == 0:
+            break
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    for p in procs:
+        p.join()
+    return elapsed
+
+
+def bench_publish(url: str, items: int) -> float:
+    queue = open_queue(url)
+    start = time.perf_counter()
+    for _ in range(items):
+        queue.publish({"kind": "sleep", "seconds": 0})
+    return items / (time.perf_counter() - start)
+
+
+def bench_drain(directory: str, items: int, workers: int, work_seconds: float) -> float:
+    url = f"sqlite:///{os.path.join(directory, f'drain-{workers}-{work_seconds}.db')}"
+    queue = open_queue(url)
+    for _ in range(items):
+        queue.publish({"kind": "sleep", "seconds": work_seconds})
+    return items / _drain(url, workers)
+
+
+def bench_lease_recovery(directory: str, items: int = 20, lease: float = 0.2) -> dict:
+    url = f"sqlite:///{os.path.join(directory, 'lease.db')}"
+    queue = open_queue(url)
+    ids = [queue.publish({"kind": "sleep", "seconds": 0}) for _ in range(items)]
+    # A worker that claims everything and then dies without completing
+    while queue.claim("crashed-worker", lease):
+        pass
+    time.sleep(lease * 1.5)
+    elapsed = _drain(url, workers=2, lease=lease)
+    done = [queue.get(i) for i in ids]
+    return {"recovered": sum(1 for item in done if item.status == "done"), "items": items,
+            "retried": sum(1 for item in done if item.attempts == 2), "seconds": round(elapsed, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=400)
+    parser.add_argument("--work-seconds", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        rate = bench_publish(f"sqlite:///{os.path.join(directory, 'publish.db')}", args.items)
+        print(f"publish: {rate:,.0f} items/s")
+        print(f"{'workers':>8} {'empty items/s':>14} {f'{args.work_seconds}s items/s':>16}")
+        for workers in (1, 2, 4):
+            empty = bench_drain(directory, args.items, workers, 0.0)
+            busy = bench_drain(directory, max(20, args.items // 8), workers, args.work_seconds)
+            print(f"{workers:>8} {empty:>14,.0f} {busy:>16,.1f}")
+        print(f"lease recovery: {bench_lease_recovery(directory)}")
+
+
+if __name__ == "__main__":
+    main()
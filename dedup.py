@@ -0,0 +1,231 @@
+"""Near-duplicate subtask detection and result reuse.
+
+Planner output and reflection follow-ups often restate the same subtask
+("Research X", "Follow-up for Research X"). Each description is normalized
+(case, punctuation, filler words, simple suffixes), cut into character
+shingles and summarized by a MinHash signature whose agreement estimates the
+Jaccard similarity of two descriptions, without an LLM call or exact match.
+
+Within a plan, a new subtask at least DEDUP_MERGE_THRESHOLD similar to an
+existing one with the same agent type is merged into it; the user query is
+cut out of both descriptions first, so a long query quoted in every subtask
+does not make distinct steps look alike. Across workflows, completed results are kept
+for DEDUP_TTL_SECONDS in an LSH-bucketed store, and a subtask reuses a stored
+result only when both the subtask and the user query it was run for are at
+least DEDUP_REUSE_THRESHOLD similar (same agent type). A result is never
+handed to a workflow asking a different question. Every merge and reuse is appended to WorkflowState.dedup_audit.
+"""
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+NUM_PERM = 64
+BANDS = 16  # LSH bands of NUM_PERM // BANDS rows each
+SHINGLE_SIZE = 4
+_MERSENNE = (1 << 61) - 1
+
+STOPWORDS = {
+    "a", "an", "and", "about", "all", "any", "as", "at", "by", "for", "from", "in", "into", "it",
+    "its", "of", "on", "or", "the", "this", "that", "these", "those", "to", "with",
+}
+# Leading phrases that do not change what a subtask asks for
+_FILLER_RE = re.compile(r"^(?:follow[\s-]*up(?:\s+(?:for|on|to))?|additional\s+work\s+(?:for|on)|"
+                        r"continue|revisit|redo|repeat)\b[\s:,-]*", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_SUFFIXES = ("ing", "ed", "es", "s")
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def normalize_text(text: str) -> str:
+    text = text.strip()
+    while True:
+        stripped = _FILLER_RE.sub("", text)
+        if stripped == text:
+            break
+        text = stripped
+    words = [_stem(w) for w in _WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+    return " ".join(words)
+
+
+def _seeds() -> List[Tuple[int, int]]:
+    seeds = []
+    for i in range(NUM_PERM):
+        digest = hashlib.sha256(f"minhash-{i}".encode()).digest()
+        a = int.from_bytes(digest[:8], "big") % (_MERSENNE - 1) + 1
+        b = int.from_bytes(digest[8:16], "big") % _MERSENNE
+        seeds.append((a, b))
+    return seeds
+
+
+_SEEDS = _seeds()
+
+
+@lru_cache(maxsize=4096)
+def minhash(text: str) -> Tuple[int, ...]:
+    """MinHash signature of a description's normalized character shingles"""
+    normalized = normalize_text(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+    return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in _SEEDS)
+
+
+def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    rows = NUM_PERM // BANDS
+    return [(band, signature[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+
+
+def _without_query(description: str, query: str) -> str:
+    """The description with any verbatim copy of the user query removed (unchanged if nothing else is left)"""
+    query = query.strip()
+    if not query:
+        return description
+    remainder = re.sub(re.escape(query), " ", description, flags=re.IGNORECASE)
+    return remainder if normalize_text(remainder) else description
+
+
+class SubtaskDeduplicator:
+    def __init__(self):
+        # A threshold of 0 disables that stage
+        self.merge_threshold = float(os.getenv("DEDUP_MERGE_THRESHOLD", "0.8"))
+        self.reuse_threshold = float(os.getenv("DEDUP_REUSE_THRESHOLD", "0.9"))
+        self.ttl = float(os.getenv("DEDUP_TTL_SECONDS", "3600"))
+        self.max_entries = int(os.getenv("DEDUP_MAX_ENTRIES", "1000"))
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], set] = {}
+        self._lock = threading.Lock()
+        self.merged = 0
+        self.reused = 0
+
+    def merge_duplicate(self, state, description: str, agent_type: str, origin: str) -> Optional[str]:
+        """Id of an existing subtask of the same agent type the new description duplicates (recorded in the audit), else None"""
+        if self.merge_threshold <= 0:
+            return None
+        signature = minhash(_without_query(description, state.user_query))
+        best_id, best = None, 0.0
+        for task_id in state.task_order:
+            task = state.subtasks.get(task_id)
+            if task is None or task.agent_type != agent_type:
+                continue
+            score = similarity(signature, minhash(_without_query(task.description, state.user_query)))
+            if score > best:
+                best_id, best = task_id, score
+        if best_id is None or best < self.merge_threshold:
+            return None
+        with self._lock:
+            self.merged += 1
+        state.dedup_audit.append({"action": "merged", "origin": origin, "description": description,
+                                  "into": best_id, "similarity": round(best, 3)})
+        print(f"🧬 Merged duplicate subtask into {best_id} ({best:.0%} similar): {description[:60]}")
+        return best_id
+
+    def lookup(self, task, query: str) -> Optional[Tuple[Dict, float]]:
+        """Most similar unexpired stored result for the same agent type and query, if above the reuse threshold"""
+        if self.reuse_threshold <= 0:
+            return None
+        signature = minhash(task.description)
+        query_signature = minhash(query)
+        with self._lock:
+            self._prune()
+            candidates = set()
+            for band in _bands(signature):
+                candidates |= self._buckets.get(band, set())
+            best, best_score = None, 0.0
+            for key in candidates:
+                entry = self._entries.get(key)
+                if entry is None or entry["agent_type"] != task.agent_type:
+                    continue
+                if similarity(query_signature, entry["query_signature"]) < self.reuse_threshold:
+                    continue
+                score = similarity(signature, entry["signature"])
+                if score > best_score:
+                    best, best_score = entry, score
+        if best is None or best_score < self.reuse_threshold:
+            return None
+        return best, best_score
+
+    def reuse(self, state, task) -> bool:
+        """Fill a first-attempt task from a stored near-identical result; True when reused"""
+        if task.retries or task.attempts > 1:
+            return False  # A retry means the earlier result was not good enough
+        found = self.lookup(task, state.user_query)
+        if found is None:
+            return False
+        entry, score = found
+        task.result = entry["result"]
+        task.sources = list(entry["sources"])
+        with self._lock:
+            self.reused += 1
+        state.dedup_audit.append({"action": "reused", "task_id": task.id, "description": task.description,
+                                  "from_description": entry["description"], "from_query": entry["query"],
+                                  "similarity": round(score, 3), "age_s": round(time.time() - entry["stored"], 1)})
+        print(f"♻️ Reused stored result for {task.id} ({score:.0%} similar)")
+        return True
+
+    def remember(self, state, task):
+        """Store a completed task's result for later workflows"""
+        if self.reuse_threshold <= 0 or not task.result:
+            return
+        signature = minhash(task.description)
+        key = self._key(state.user_query, task)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {"signature": signature, "description": task.description,
+                                  "agent_type": task.agent_type, "result": task.result,
+                                  "sources": list(task.sources), "query": state.user_query,
+                                  "query_signature": minhash(state.user_query),
+                                  "stored": time.time()}
+            for band in _bands(signature):
+                self._buckets.setdefault(band, set()).add(key)
+            self._prune()
+
+    def forget(self, state, task):
+        """Drop a stored result that feedback has rejected"""
+        with self._lock:
+            self._remove(self._key(state.user_query, task))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"stored": len(self._entries), "merged": self.merged, "reused": self.reused,
+                    "merge_threshold": self.merge_threshold, "reuse_threshold": self.reuse_threshold}
+
+    def _key(self, query: str, task) -> str:
+        text = f"{task.agent_type}|{normalize_text(query)}|{normalize_text(task.description)}"
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in _bands(entry["signature"]):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        while self._entries:
+            key, oldest = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and oldest["stored"] >= cutoff:
+                break
+            self._remove(key)
@@ -0,0 +1,476 @@
+"""Local document corpus for the research_agent's web_search/document_analysis tools.
+
+The index is segment based: every ingest run writes one new immutable segment
+for new or changed documents and tombstones the passages they replace, so
+re-ingesting a large corpus only touches what changed. Postings, passage
+lengths and passage offsets are flat binary files that are memory-mapped at
+query time, so opening an index does not load the corpus into memory.
+
+Usage:
+    python document_index.py ingest ./docs --index ./doc_index [--dense]
+    python document_index.py search "query text" --index ./doc_index
+    python document_index.py compact --index ./doc_index
+"""
+import os
+import re
+import json
+import math
+import mmap
+import heapq
+import zlib
+import argparse
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Iterable, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional: BM25 works without it, the dense index does not
+    np = None
+
+SUPPORTED_EXTENSIONS = {".txt", ".md", ".rst", ".html", ".htm", ".csv"}
+RETRIEVAL_TOOLS = {"web_search", "document_analysis"}
+
+PASSAGE_WORDS = 120
+PASSAGE_STRIDE = 100
+MAX_SEGMENTS = 8
+DENSE_DIM = 256
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in",
+    "is", "it", "its", "of", "on", "or", "that", "the", "this", "to", "was",
+    "were", "will", "with",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def chunk_text(text: str) -> List[str]:
+    """Split a document into overlapping passages of PASSAGE_WORDS words"""
+    words = text.split()
+    if not words:
+        return []
+    passages = []
+    for start in range(0, len(words), PASSAGE_STRIDE):
+        passages.append(" ".join(words[start:start + PASSAGE_WORDS]))
+        if start + PASSAGE_WORDS >= len(words):
+            break
+    return passages
+
+
+def _read_document(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    if path.lower().endswith((".html", ".htm")):
+        text = _TAG_RE.sub(" ", text)
+    return text
+
+
+class HashingEmbedder:
+    """Signed feature-hashing embedder: local, deterministic and dependency free apart from NumPy"""
+
+    def __init__(self, dim: int = DENSE_DIM):
+        self.dim = dim
+
+    def __call__(self, text: str):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            h = zlib.crc32(token.encode("utf-8"))
+            vec[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+
+@dataclass
+class Passage:
+    source: str
+    text: str
+    score: float
+
+
+def _mmap_file(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _Segment:
+    """Read-only view over one on-disk segment"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as f:
+            self.terms: Dict[str, List[int]] = json.load(f)
+        self._postings = _mmap_file(os.path.join(path, "postings.bin"))
+        self._passages = _mmap_file(os.path.join(path, "passages.jsonl"))
+        self.lengths = memoryview(_mmap_file(os.path.join(path, "lengths.bin"))).cast("B").cast("I")
+        self.offsets = memoryview(_mmap_file(os.path.join(path, "passages.idx"))).cast("B").cast("Q")
+        self.size = len(self.lengths)
+        self.dense = None
+        dense_path = os.path.join(path, "dense.npy")
+        if np is not None and os.path.exists(dense_path):
+            self.dense = np.load(dense_path, mmap_mode="r")
+
+    def postings(self, term: str) -> Tuple[memoryview, int]:
+        entry = self.terms.get(term)
+        if not entry:
+            return memoryview(b"").cast("I"), 0
+        offset, df = entry
+        view = memoryview(self._postings)[offset * 8:(offset + df) * 8].cast("I")
+        return view, df
+
+    def passage(self, local_id: int) -> Dict:
+        start = self.offsets[local_id]
+        end = self.offsets[local_id + 1] if local_id + 1 < len(self.offsets) else len(self._passages)
+        return json.loads(bytes(self._passages[start:end]).decode("utf-8"))
+
+
+def _score_segment(segment: _Segment, idf: Dict[str, float], avgdl: float,
+                   deleted: set, k: int) -> List[Tuple[float, int]]:
+    """BM25 top-k for one segment; vectorised over the postings lists when NumPy is available"""
+    if np is not None:
+        acc = np.zeros(segment.size, dtype=np.float32)
+        lengths = np.frombuffer(segment.lengths, dtype=np.uint32)
+        for term, weight in idf.items():
+            view, count = segment.postings(term)
+            if not count:
+                continue
+            pairs = np.frombuffer(view, dtype=np.uint32).reshape(-1, 2)
+            ids, tf = pairs[:, 0], pairs[:, 1].astype(np.float32)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[ids] / avgdl)
+            acc[ids] += weight * tf * (BM25_K1 + 1) / (tf + norm)
+        if deleted:
+            acc[list(deleted)] = 0.0
+        candidates = np.flatnonzero(acc)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-acc[candidates], k - 1)[:k]]
+        return [(float(acc[i]), int(i)) for i in candidates]
+
+    scores: Dict[int, float] = {}
+    for term, weight in idf.items():
+        view, count = segment.postings(term)
+        for i in range(count):
+            local_id, tf = view[2 * i], view[2 * i + 1]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * segment.lengths[local_id] / avgdl)
+            scores[local_id] = scores.get(local_id, 0.0) + weight * tf * (BM25_K1 + 1) / (tf + norm)
+    for local_id in deleted:
+        scores.pop(local_id, None)
+    return [(score, local_id) for local_id, score in heapq.nlargest(k, scores.items(), key=lambda x: x[1])]
+
+
+class DocumentIndex:
+    """Incremental on-disk index with BM25 ranking and an optional dense-vector index"""
+
+    def __init__(self, index_dir: str, dense: Optional[bool] = None):
+        self.index_dir = index_dir
+        self.manifest_path = os.path.join(index_dir, "manifest.json")
+        self.manifest = self._load_manifest()
+        if dense is not None:
+            if dense and np is None:
+                raise RuntimeError("The dense index requires numpy")
+            self.manifest["dense_dim"] = DENSE_DIM if dense else 0
+        self.use_dense = dense  # False keeps queries BM25-only even when the index has dense vectors
+        self.embedder = HashingEmbedder(self.manifest["dense_dim"]) if self.manifest["dense_dim"] and np is not None else None
+        self._segments: Dict[str, _Segment] = {}
+        self._deleted: Dict[str, set] = {}
+        self._stats: Tuple[int, float] = (0, 0.0)
+        self._manifest_mtime = 0.0
+        self._lock = threading.Lock()
+
+    # ---- ingestion ----
+
+    def _load_manifest(self) -> Dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"version": 1, "next_segment": 1, "segments": [], "documents": {}, "deleted": {}, "dense_dim": 0}
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    def ingest(self, corpus_dir: str) -> Dict[str, int]:
+        """Index new and changed documents under corpus_dir and tombstone removed ones"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        documents = self.manifest["documents"]
+        seen = set()
+        new_passages: List[Dict] = []
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+
+        for root, _, files in os.walk(corpus_dir):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                    continue
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, corpus_dir)
+                seen.add(rel)
+                st = os.stat(path)
+                known = documents.get(rel)
+                if known and known["mtime"] == st.st_mtime and known["size"] == st.st_size:
+                    stats["unchanged"] += 1
+                    continue
+                if known:
+                    self._tombstone(known)
+                    stats["updated"] += 1
+                else:
+                    stats["added"] += 1
+                passages = chunk_text(_read_document(path))
+                documents[rel] = {"mtime": st.st_mtime, "size": st.st_size,
+                                  "segment": None, "passages": [len(new_passages), len(passages)]}
+                new_passages.extend({"source": rel, "text": p} for p in passages)
+
+        for rel in [r for r in documents if r not in seen]:
+            self._tombstone(documents.pop(rel))
+            stats["removed"] += 1
+
+        if new_passages:
+            name = self._write_segment(new_passages)
+            for doc in documents.values():
+                if doc["segment"] is None:
+                    doc["segment"] = name
+
+        self._save_manifest()
+        if len(self.manifest["segments"]) > MAX_SEGMENTS:
+            self.compact()
+        return stats
+
+    def _tombstone(self, doc: Dict):
+        if doc.get("segment") is None:
+            return
+        start, count = doc["passages"]
+        deleted = self.manifest["deleted"].setdefault(doc["segment"], [])
+        deleted.extend(range(start, start + count))
+
+    def _write_segment(self, passages: List[Dict]) -> str:
+        name = f"seg_{self.manifest['next_segment']:06d}"
+        self.manifest["next_segment"] += 1
+        path = os.path.join(self.index_dir, name)
+        os.makedirs(path, exist_ok=True)
+
+        inverted: Dict[str, List[int]] = {}
+        lengths = array("I")
+        offsets = array("Q")
+        with open(os.path.join(path, "passages.jsonl"), "wb") as f:
+            for local_id, passage in enumerate(passages):
+                offsets.append(f.tell())
+                f.write(json.dumps(passage).encode("utf-8") + b"\n")
+                tokens = tokenize(passage["text"])
+                lengths.append(len(tokens))
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, tf in counts.items():
+                    inverted.setdefault(token, []).extend((local_id, tf))
+
+        terms = {}
+        postings = array("I")
+        for term in sorted(inverted):
+            pairs = inverted[term]
+            terms[term] = [len(postings) // 2, len(pairs) // 2]
+            postings.extend(pairs)
+
+        with open(os.path.join(path, "postings.bin"), "wb") as f:
+            postings.tofile(f)
+        with open(os.path.join(path, "lengths.bin"), "wb") as f:
+            lengths.tofile(f)
+        with open(os.path.join(path, "passages.idx"), "wb") as f:
+            offsets.tofile(f)
+        with open(os.path.join(path, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f)
+        if self.embedder is not None:
+            np.save(os.path.join(path, "dense.npy"),
+                    np.stack([self.embedder(p["text"]) for p in passages]).astype(np.float32))
+
+        self.manifest["segments"].append(name)
+        return name
+
+    def compact(self):
+        """Merge all segments into one, dropping tombstoned passages"""
+        self._refresh()
+        old_segments = list(self.manifest["segments"])
+        passages: List[Dict] = []
+        remap: Dict[Tuple[str, int], int] = {}
+        for name in old_segments:
+            segment = self._segments[name]
+            deleted = self._deleted.get(name, set())
+            for local_id in range(segment.size):
+                if local_id not in deleted:
+                    remap[(name, local_id)] = len(passages)
+                    passages.append(segment.passage(local_id))
+
+        self.manifest["segments"] = []
+        self.manifest["deleted"] = {}
+        if passages:
+            name = self._write_segment(passages)
+            for doc in self.manifest["documents"].values():
+                start, count = doc["passages"]
+                new_start = remap.get((doc["segment"], start), 0)
+                doc["segment"], doc["passages"] = name, [new_start, count]
+        self._save_manifest()
+
+        with self._lock:
+            self._segments = {}
+        for name in old_segments:
+            seg_path = os.path.join(self.index_dir, name)
+            for fname in os.listdir(seg_path):
+                os.remove(os.path.join(seg_path, fname))
+            os.rmdir(seg_path)
+
+    # ---- querying ----
+
+    def _refresh(self):
+        """Reopen segments when another process has ingested since the last query"""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._manifest_mtime and self._segments:
+            return
+        with self._lock:
+            self.manifest = self._load_manifest()
+            segments = {name: self._segments.get(name) or _Segment(os.path.join(self.index_dir, name))
+                        for name in self.manifest["segments"]}
+            deleted = {name: set(ids) for name, ids in self.manifest["deleted"].items()}
+            total_docs, total_len = 0, 0
+            for name, segment in segments.items():
+                dead = deleted.get(name, set())
+                total_docs += segment.size - len(dead)
+                total_len += sum(segment.lengths) - sum(segment.lengths[i] for i in dead)
+            self._segments, self._deleted = segments, deleted
+            self._stats = (total_docs, total_len / total_docs if total_docs else 0.0)
+            self._manifest_mtime = mtime
+            if self.manifest["dense_dim"] and np is not None and self.embedder is None and self.use_dense is not False:
+                self.embedder = HashingEmbedder(self.manifest["dense_dim"])
+
+    def _bm25(self, tokens: List[str], k: int) -> List[Tuple[float, str, int]]:
+        n_docs, avgdl = self._stats
+        if not n_docs:
+            return []
+        # Document frequencies include tombstoned passages until the next compaction
+        df = {t: sum(seg.terms.get(t, (0, 0))[1] for seg in self._segments.values()) for t in set(tokens)}
+        idf = {t: math.log(1 + (n_docs - d + 0.5) / (d + 0.5)) for t, d in df.items() if d}
+
+        hits: List[Tuple[float, str, int]] = []
+        for name, segment in self._segments.items():
+            deleted = self._deleted.get(name, set())
+            top = _score_segment(segment, idf, avgdl, deleted, k)
+            hits.extend((score, name, local_id) for score, local_id in top)
+        return heapq.nlargest(k, hits)
+
+    def _dense(self, query: str, k: int) -> List[Tuple[float, str, int]]:
+        if self.embedder is None:
+            return []
+        q = self.embedder(query)
+        hits: List[Tuple[float, str, int]] = []
+        for name, segment in self._segments.items():
+            if segment.dense is None or not segment.size:
+                continue
+            scores = np.asarray(segment.dense @ q, dtype=np.float32)
+            candidates = np.arange(segment.size)
+            deleted = self._deleted.get(name)
+            if deleted:
+                # Tombstoned passages must never reach the fused ranking, however low they score
+                candidates = np.setdiff1d(candidates, np.fromiter(deleted, dtype=np.int64), assume_unique=True)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            hits.extend((float(scores[i]), name, int(i)) for i in candidates)
+        return heapq.nlargest(k, hits)
+
+    def search(self, query: str, k: int = 5) -> List[Passage]:
+        """Return the top-k passages, fusing BM25 and dense rankings when both are available"""
+        self._refresh()
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        bm25 = self._bm25(tokens, k * 2)
+        dense = self._dense(query, k * 2)
+        if dense:
+            fused: Dict[Tuple[str, int], float] = {}
+            for ranking in (bm25, dense):
+                for rank, (_, name, local_id) in enumerate(ranking):
+                    fused[(name, local_id)] = fused.get((name, local_id), 0.0) + 1.0 / (RRF_K + rank + 1)
+            ranked = heapq.nlargest(k, ((s, n, i) for (n, i), s in fused.items()))
+        else:
+            ranked = bm25[:k]
+
+        results = []
+        for score, name, local_id in ranked:
+            data = self._segments[name].passage(local_id)
+            results.append(Passage(source=data["source"], text=data["text"], score=round(score, 4)))
+        return results
+
+
+def format_passages(passages: Iterable[Passage], max_chars: int = 600) -> str:
+    """Render passages as a prompt section for the ToolAgent"""
+    lines = []
+    for i, p in enumerate(passages, 1):
+        text = p.text if len(p.text) <= max_chars else p.text[:max_chars] + "..."
+        lines.append(f"[{i}] ({p.source}) {text}")
+    return "\n".join(lines)
+
+
+_retriever: Optional[DocumentIndex] = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever() -> Optional[DocumentIndex]:
+    """Shared index configured by DOCUMENT_INDEX_DIR, or None when no local corpus is set up"""
+    global _retriever
+    index_dir = os.getenv("DOCUMENT_INDEX_DIR")
+    if not index_dir or not os.path.exists(os.path.join(index_dir, "manifest.json")):
+        return None
+    with _retriever_lock:
+        if _retriever is None or _retriever.index_dir != index_dir:
+            _retriever = DocumentIndex(index_dir)
+        return _retriever
+
+
+def retrieve_context(query: str, tools: List[str]) -> Tuple[str, List[str]]:
+    """Top-k passages for a task whose tools are backed by the local corpus"""
+    retriever = get_retriever()
+    if retriever is None or not RETRIEVAL_TOOLS.intersection(tools):
+        return "", []
+    passages = retriever.search(query, k=int(os.getenv("RETRIEVAL_TOP_K", "4")))
+    return format_passages(passages), sorted({p.source for p in passages})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local document index for the research agent")
+    parser.add_argument("command", choices=["ingest", "search", "compact"])
+    parser.add_argument("target", nargs="?", help="corpus directory (ingest) or query text (search)")
+    parser.add_argument("--index", default=os.getenv("DOCUMENT_INDEX_DIR", "doc_index"))
+    parser.add_argument("--dense", action="store_true", help="also build the NumPy dense-vector index")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        if not args.target:
+            parser.error("ingest needs a corpus directory")
+        index = DocumentIndex(args.index, dense=True if args.dense else None)
+        stats = index.ingest(args.target)
+        print(f"✅ Indexed {args.target}: {stats['added']} added, {stats['updated']} updated, "
+              f"{stats['removed']} removed, {stats['unchanged']} unchanged")
+    elif args.command == "search":
+        if not args.target:
+            parser.error("search needs a query")
+        for p in DocumentIndex(args.index).search(args.target, k=args.k):
+            print(f"📄 {p.source} ({p.score})\n   {p.text[:200]}")
+    else:
+        DocumentIndex(args.index).compact()
+        print("✅ Compacted index")
+
+
+if __name__ == "__main__":
+    main()
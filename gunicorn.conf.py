@@ -0,0 +1,61 @@
+"""Production gunicorn configuration: gunicorn -c gunicorn.conf.py
+
+WEB_WORKER_CLASS picks how each worker waits on the (slow, I/O-bound) LLM
+calls of the requests it serves:
+    gthread  threads per worker (default)
+    gevent   green threads; thousands of waiting requests per worker
+             (request profiling records spans but no stack samples here:
+             greenlets are invisible to sys._current_frames())
+    uvicorn  ASGI event loop via asgi.py, Flask running in its thread pool
+    sync     one request per worker at a time
+
+The app is preloaded once and forked, and every worker then builds its own
+API client. Workers on a host share query history and LLM responses through
+the SQLite cache in SHARED_CACHE_PATH (on /dev/shm when available).
+"""
+import os
+import multiprocessing
+
+worker_class_name = os.getenv("WEB_WORKER_CLASS", "gthread")
+
+if worker_class_name == "gevent":
+    # Must happen before the app (and anything using sockets or threads) is imported
+    from gevent import monkey
+    monkey.patch_all()
+    os.environ.setdefault("GEMINI_TRANSPORT", "rest")
+
+if "SHARED_CACHE_PATH" not in os.environ:
+    shm = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    os.environ["SHARED_CACHE_PATH"] = os.path.join(shm or ".", "agentic_workflow_cache.db")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+preload_app = True
+# A workflow makes several sequential LLM calls; keep this above WORKFLOW_TIMEOUT_SECONDS
+timeout = int(os.getenv("WEB_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+if worker_class_name == "gevent":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("WEB_WORKER_CONNECTIONS", "1000"))
+elif worker_class_name == "uvicorn":
+    worker_class = "uvicorn.workers.UvicornWorker"
+    wsgi_app = "asgi:application"
+elif worker_class_name == "gthread":
+    worker_class = "gthread"
+    threads = int(os.getenv("WEB_THREADS", "16"))
+elif worker_class_name == "sync":
+    worker_class = "sync"
+else:
+    raise ValueError(f"Unsupported WEB_WORKER_CLASS: {worker_class_name}")
+
+if worker_class_name != "uvicorn":
+    wsgi_app = "app:app"
+
+
+def post_fork(server, worker):
+    import app
+    app.init_clients()
+    server.log.info(f"Worker {worker.pid} initialized its Gemini client ({worker_class_name})")
@@ -0,0 +1,233 @@
+"""Record and replay of LLM interactions for deterministic load testing.
+
+Recording (LLM_RECORD_PATH) appends every prompt, response, latency and error
+to a JSONL log, buffered and written in batches; responses served from the LLM
+cache or shared with an identical in-flight call are logged too, marked
+cached or coalesced. Workflow requests are logged as well, so the log also
+captures the arrival pattern of real traffic.
+
+Replay (LLM_REPLAY_PATH) serves the recorded responses back with their
+original latency, optionally scaled by LLM_REPLAY_TIME_SCALE, so the web app
+and the CLI run without network access.
+
+Load test against recorded traffic:
+    python llm_recording.py loadtest --log llm_log.jsonl --target http://localhost:8000
+    python llm_recording.py loadtest --log llm_log.jsonl --target cli
+"""
+import os
+import json
+import time
+import atexit
+import hashlib
+import argparse
+import statistics
+import threading
+import urllib.request
+from typing import Dict, List, Optional
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class InteractionRecorder:
+    """Append-only JSONL log written in batches by a background flusher"""
+
+    def __init__(self, path: str, batch_size: int = 50, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="llm-recorder", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls) -> Optional["InteractionRecorder"]:
+        path = os.getenv("LLM_RECORD_PATH")
+        if not path:
+            return None
+        return cls(path, int(os.getenv("LLM_RECORD_BATCH", "50")), float(os.getenv("LLM_RECORD_FLUSH_SECONDS", "1.0")))
+
+    def record(self, prompt: str, response: Optional[str], latency: float, error: Optional[str] = None,
+               cached: bool = False, coalesced: bool = False):
+        """Log one LLM call; cached / coalesced mark a response taken from the LLM cache / an identical in-flight call"""
+        self._append({"kind": "llm", "ts": time.time(), "prompt_hash": prompt_hash(prompt), "prompt": prompt,
+                      "response": response, "latency": round(latency, 4), "error": error, "cached": cached,
+                      "coalesced": coalesced})
+
+    def record_request(self, query: str, latency: float, status: str = "ok", arrival: Optional[float] = None):
+        """Log a workflow request at its arrival time, which loadtest replays the traffic by"""
+        ts = arrival if arrival is not None else time.time() - latency
+        self._append({"kind": "request", "ts": ts, "query": query,
+                      "latency": round(latency, 4), "status": status})
+
+    def _append(self, entry: Dict):
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        # One write per batch keeps batches from different workers from interleaving mid-line
+        with self._write_lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+def load_log(path: str) -> List[Dict]:
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # Tolerate a torn last line from a crashed writer
+    return entries
+
+
+class ReplayBackend:
+    """Serves recorded responses by prompt, sleeping for the recorded (scaled) latency"""
+
+    def __init__(self, path: str, time_scale: float = 1.0):
+        self.path = path
+        self.time_scale = time_scale
+        self._responses: Dict[str, List[Dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        latencies = []
+        for entry in load_log(path):
+            if entry.get("kind") == "llm":
+                self._responses.setdefault(entry["prompt_hash"], []).append(entry)
+                if not entry.get("cached") and not entry.get("coalesced"):
+                    latencies.append(entry.get("latency", 0.0))
+        # Unrecorded prompts still cost a typical call's time so load shapes stay realistic
+        self.miss_latency = statistics.median(latencies) if latencies else 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ReplayBackend"]:
+        path = os.getenv("LLM_REPLAY_PATH")
+        if not path:
+            return None
+        return cls(path, float(os.getenv("LLM_REPLAY_TIME_SCALE", "1.0")))
+
+    def generate(self, prompt: str) -> Optional[str]:
+        """Recorded response for the prompt, or None when it was never recorded"""
+        key = prompt_hash(prompt)
+        with self._lock:
+            recorded = self._responses.get(key)
+            if recorded:
+                # Repeated prompts cycle through their recorded responses in order
+                i = self._cursor.get(key, 0)
+                self._cursor[key] = i + 1
+                entry = recorded[i % len(recorded)]
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+
+        time.sleep((entry["latency"] if entry else self.miss_latency) * self.time_scale)
+        if entry is None:
+            return None
+        if entry.get("error"):
+            raise RuntimeError(f"Replayed error: {entry['error']}")
+        return entry.get("response") or ""
+
+
+def _run_cli_query(query: str):
+    from agentic_workflow import create_workflow, WorkflowState
+    create_workflow().invoke(WorkflowState(user_query=query), config={"recursion_limit": 100})
+
+
+def _run_http_query(base_url: str, query: str):
+    req = urllib.request.Request(f"{base_url.rstrip('/')}/process", data=json.dumps({"query": query}).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(req, timeout=600) as resp:
+        resp.read()
+
+
+def loadtest(log_path: str, target: str, time_scale: float = 1.0, limit: Optional[int] = None) -> Dict:
+    """Re-issue the recorded workflow requests with their original inter-arrival gaps (scaled)"""
+    requests_log = [e for e in load_log(log_path) if e.get("kind") == "request"]
+    if limit:
+        requests_log = requests_log[:limit]
+    if not requests_log:
+        raise ValueError(f"No recorded requests in {log_path}")
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def issue(query: str):
+        start = time.perf_counter()
+        try:
+            if target == "cli":
+                _run_cli_query(query)
+            else:
+                _run_http_query(target, query)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+
+    threads = []
+    origin, began = requests_log[0]["ts"], time.perf_counter()
+    for entry in requests_log:
+        delay = (entry["ts"] - origin) * time_scale - (time.perf_counter() - began)
+        if delay > 0:
+            time.sleep(delay)
+        t = threading.Thread(target=issue, args=(entry["query"],), daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+    elapsed = time.perf_counter() - began
+    latencies.sort()
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+    return {"requests": len(requests_log), "ok": len(latencies), "errors": len(errors),
+            "elapsed_s": round(elapsed, 3), "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else None,
+            "p50_s": pct(0.5), "p95_s": pct(0.95), "max_s": pct(1.0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded workflow traffic")
+    parser.add_argument("command", choices=["loadtest"])
+    parser.add_argument("--log", required=True, help="JSONL log written with LLM_RECORD_PATH")
+    parser.add_argument("--target", default="http://localhost:8000", help="server base URL, or 'cli' to run in-process")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="scale recorded inter-arrival gaps")
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    # Replay the recorded LLM responses too unless the caller configured something else
+    os.environ.setdefault("LLM_REPLAY_PATH", args.log)
+    os.environ.pop("LLM_RECORD_PATH", None)
+    stats = loadtest(args.log, args.target, args.time_scale, args.limit)
+    print("📈 Load test results")
+    for key, value in stats.items():
+        print(f"   {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
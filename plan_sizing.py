@@ -0,0 +1,161 @@
+"""Budget-driven plan sizing.
+
+A cheap local complexity estimate of the query sets how many subtasks the
+planner asks for. Historical per-node timings then turn a per-request latency
+budget into a plan size and a degree of parallelism; subtasks only run in
+parallel when a work queue is configured. Only genuinely trivial queries (a
+short single-sentence question or command such as "Define entropy") and
+budgets too small for any plan at all take a single-call fast path; every
+request for work gets a plan.
+"""
+import os
+import re
+import math
+import time
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+FAST_PATH_THRESHOLD = float(os.getenv("PLAN_FAST_PATH_THRESHOLD", "0.2"))
+FAST_PATH_MAX_WORDS = int(os.getenv("PLAN_FAST_PATH_MAX_WORDS", "12"))
+# Commands are held to a tighter limit than questions: "Tell me a joke", not "Help me learn ML in 3 months"
+FAST_PATH_MAX_COMMAND_WORDS = int(os.getenv("PLAN_FAST_PATH_MAX_COMMAND_WORDS", "6"))
+MAX_PARALLELISM = int(os.getenv("PLAN_MAX_PARALLELISM", "4"))
+MIN_SUBTASKS = 3
+MAX_SUBTASKS = 5
+# Complexity at which a plan reaches MAX_SUBTASKS
+FULL_PLAN_COMPLEXITY = 0.5
+
+COMPLEX_KEYWORDS = {
+    "analyze", "analyse", "analysis", "architecture", "compare", "comparison", "comprehensive",
+    "design", "evaluate", "evaluation", "implement", "migration", "plan", "pros", "report",
+    "research", "roadmap", "step", "steps", "strategy", "tradeoffs", "versus", "vs",
+}
+_CLAUSE_RE = re.compile(r",|;|\band\b|\bthen\b|\balso\b|\bplus\b", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z]+")
+_QUESTION_WORDS = {
+    "what", "who", "whom", "whose", "when", "where", "which", "why", "how",
+    "is", "are", "was", "were", "do", "does", "did", "can", "could", "should", "would", "will",
+}
+# Commands that ask for a project rather than an answer, however short ("Build a website")
+_PROJECT_VERBS = {"build", "create", "develop", "implement", "help", "teach", "learn", "setup", "set", "organize"}
+_SENTENCE_END_RE = re.compile(r"[.!?]+\s+\S")
+
+# Seconds per node before any run has been observed
+DEFAULT_NODE_SECONDS = {
+    "plan": 2.0, "task_selector": 0.0, "agent_dispatch": 0.0,
+    "tool_agent": 3.0, "reflection": 1.5, "finalize": 0.0,
+}
+PER_TASK_NODES = ("task_selector", "agent_dispatch", "tool_agent", "reflection")
+
+
+def estimate_complexity(query: str) -> float:
+    """0..1 score from length, clause count, multi-part markers and task keywords"""
+    words = _WORD_RE.findall(query.lower())
+    length = min(len(words) / 40, 1.0)
+    clauses = min(len(_CLAUSE_RE.findall(query)) / 4, 1.0)
+    keywords = min(sum(1 for w in words if w in COMPLEX_KEYWORDS) / 2, 1.0)
+    multipart = 1.0 if query.count("?") > 1 or re.search(r"^\s*(\d+[.)]|[-*•])\s", query, re.MULTILINE) else 0.0
+    return round(0.35 * length + 0.25 * clauses + 0.3 * keywords + 0.1 * multipart, 3)
+
+
+def is_trivial(query: str) -> bool:
+    """Short single-sentence question or command without task keywords, e.g. 'What is the capital of France?'"""
+    text = query.strip()
+    words = text.split()
+    if not words or len(words) > FAST_PATH_MAX_WORDS or _SENTENCE_END_RE.search(text):
+        return False
+    first = words[0].lower().strip(",")
+    question = text.endswith("?") or first in _QUESTION_WORDS
+    if not question:
+        if len(words) > FAST_PATH_MAX_COMMAND_WORDS or first in _PROJECT_VERBS:
+            return False
+        if any(w in COMPLEX_KEYWORDS for w in _WORD_RE.findall(text.lower())):
+            return False
+    return estimate_complexity(text) < FAST_PATH_THRESHOLD
+
+
+class NodeTimings:
+    """Exponentially weighted per-node durations observed in this process"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._means: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, node: str, seconds: float):
+        with self._lock:
+            prev = self._means.get(node)
+            self._means[node] = seconds if prev is None else prev + self.alpha * (seconds - prev)
+
+    def mean(self, node: str) -> float:
+        with self._lock:
+            return self._means.get(node, DEFAULT_NODE_SECONDS.get(node, 0.0))
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {node: round(seconds, 4) for node, seconds in self._means.items()}
+
+    def timed(self, name: str, node: Callable) -> Callable:
+        def timed_node(state):
+            start = time.perf_counter()
+            try:
+                return node(state)
+            finally:
+                self.observe(name, time.perf_counter() - start)
+        return timed_node
+
+
+node_timings = NodeTimings()
+
+
+@dataclass
+class PlanSize:
+    subtasks: int
+    max_parallelism: int
+    fast_path: bool
+    complexity: float
+    reason: str
+
+
+def choose_plan_size(query: str, latency_budget: float = 0.0, cost_budget: float = 0.0,
+                     cost_per_call: float = 0.0, calls_per_task: int = 2,
+                     timings: Optional[NodeTimings] = None, concurrent: Optional[bool] = None) -> PlanSize:
+    """concurrent: whether subtasks can run in parallel (default: a work queue is configured)"""
+    timings = timings or node_timings
+    if concurrent is None:
+        concurrent = bool(os.getenv("WORK_QUEUE_URL"))
+    complexity = estimate_complexity(query)
+    if is_trivial(query):
+        return PlanSize(0, 1, True, complexity, "trivial query")
+
+    span = min(complexity / FULL_PLAN_COMPLEXITY, 1.0)
+    subtasks = MIN_SUBTASKS + round(span * (MAX_SUBTASKS - MIN_SUBTASKS))
+    # Without a latency budget a concurrent executor may run the whole plan at once
+    parallelism = min(MAX_PARALLELISM, subtasks) if concurrent else 1
+    reason = "complexity"
+
+    if latency_budget:
+        fixed = timings.mean("plan") + timings.mean("finalize")
+        per_task = sum(timings.mean(node) for node in PER_TASK_NODES) or 1e-3
+        capacity = int((latency_budget - fixed) // per_task)
+        if capacity < 1:
+            return PlanSize(0, 1, True, complexity, "latency budget too small for a plan")
+        # Use only as much parallelism as the budget needs, to spare the shared API quota
+        parallelism = 1
+        if capacity < subtasks:
+            if concurrent:
+                parallelism = min(MAX_PARALLELISM, math.ceil(subtasks / capacity))
+            # In-process execution is sequential, so only capacity tasks fit in the budget
+            subtasks = min(subtasks, capacity * parallelism)
+            reason = "latency budget"
+
+    if cost_budget and cost_per_call:
+        affordable = int((cost_budget - cost_per_call) // (cost_per_call * calls_per_task))
+        if affordable < 1:
+            return PlanSize(0, 1, True, complexity, "cost budget too small for a plan")
+        if affordable < subtasks:
+            subtasks = affordable
+            reason = "cost budget"
+
+    return PlanSize(subtasks, parallelism, False, complexity, reason)
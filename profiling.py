@@ -0,0 +1,184 @@
+"""Opt-in per-request profiling.
+
+A RequestProfiler records a timeline of spans (graph nodes, LLM calls,
+serialization) and samples the Python stacks of the threads running them.
+The result is exported as Chrome trace JSON, which chrome://tracing,
+Perfetto and speedscope all open as a flame chart. Under gevent workers the
+spans are still recorded but stacks are not: sys._current_frames() only sees
+OS threads, not the greenlets that run requests there.
+
+Nothing here runs unless a request asks for it: nodes are only wrapped when
+a profiler is passed to create_workflow, and the LLM hook is a single
+ContextVar lookup.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+MAX_STACK_DEPTH = 64
+
+_active: ContextVar[Optional["RequestProfiler"]] = ContextVar("active_profiler", default=None)
+
+
+def active_profiler() -> Optional["RequestProfiler"]:
+    return _active.get()
+
+
+class RequestProfiler:
+    def __init__(self, label: str, interval: Optional[float] = None):
+        self.label = label
+        self.id = uuid.uuid4().hex[:8]
+        self.interval = interval or float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000
+        self.spans: List[Dict] = []
+        self.samples: List[Tuple[float, int, Tuple[str, ...]]] = []
+        self._threads = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self.t0 = 0.0
+        self.t1 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        self._threads.add(threading.get_ident())
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.id}", daemon=True)
+        self._sampler.start()
+        self._token = _active.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _active.reset(self._token)
+        self._stop.set()
+        self._sampler.join()
+        self.t1 = time.perf_counter()
+        return False
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads)
+            for tid in threads:
+                frame = frames.get(tid)
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.samples.append((now, tid, tuple(reversed(stack))))
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args):
+        tid = threading.get_ident()
+        with self._lock:
+            self._threads.add(tid)
+        token = _active.set(self)
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            _active.reset(token)
+            with self._lock:
+                self.spans.append({"name": name, "cat": cat, "start": start, "end": end, "tid": tid, "args": args})
+
+    def wrap_node(self, name: str, node: Callable) -> Callable:
+        def profiled_node(state):
+            with self.span(name, "node"):
+                return node(state)
+        return profiled_node
+
+    # ---- analysis / export ----
+
+    def critical_path(self) -> List[Dict]:
+        """Walk back from the last node to finish, always taking the latest node that ended before it began"""
+        nodes = sorted((s for s in self.spans if s["cat"] == "node"), key=lambda s: s["end"])
+        path = []
+        current = nodes[-1] if nodes else None
+        while current is not None:
+            path.append(current)
+            earlier = [s for s in nodes if s["end"] <= current["start"]]
+            current = earlier[-1] if earlier else None
+        return list(reversed(path))
+
+    def summary(self) -> Dict:
+        def ms(seconds: float) -> float:
+            return round(seconds * 1000, 2)
+
+        nodes: Dict[str, Dict] = {}
+        for s in self.spans:
+            if s["cat"] == "node":
+                entry = nodes.setdefault(s["name"], {"count": 0, "total_ms": 0.0})
+                entry["count"] += 1
+                entry["total_ms"] += ms(s["end"] - s["start"])
+        by_cat: Dict[str, float] = {}
+        for s in self.spans:
+            by_cat[s["cat"]] = by_cat.get(s["cat"], 0.0) + (s["end"] - s["start"])
+        invoke = sum(s["end"] - s["start"] for s in self.spans if s["name"] == "graph.invoke")
+
+        return {
+            "id": self.id,
+            "wall_ms": ms(self.t1 - self.t0),
+            "llm_calls": sum(1 for s in self.spans if s["cat"] == "llm"),
+            "llm_ms": ms(by_cat.get("llm", 0.0)),
+            "node_self_ms": ms(by_cat.get("node", 0.0) - by_cat.get("llm", 0.0)),
+            "graph_overhead_ms": ms(invoke - by_cat.get("node", 0.0)) if invoke else None,
+            "serialization_ms": ms(sum(s["end"] - s["start"] for s in self.spans if s["name"] == "serialize")),
+            "nodes": {name: dict(v, total_ms=round(v["total_ms"], 2)) for name, v in nodes.items()},
+            "critical_path": [s["name"] for s in self.critical_path()],
+            "samples": len(self.samples),
+        }
+
+    def to_chrome_trace(self) -> Dict:
+        def us(t: float) -> float:
+            return round((t - self.t0) * 1e6, 1)
+
+        critical = {id(s) for s in self.critical_path()}
+        tids = {tid: i + 1 for i, tid in enumerate(sorted({s["tid"] for s in self.spans} | {t for _, t, _ in self.samples}))}
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"request {self.label[:60]}"}}]
+        for tid, n in tids.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": n, "args": {"name": f"spans {n}"}})
+            events.append({"name": "thread_name", "ph": "M", "pid": 2, "tid": n, "args": {"name": f"samples {n}"}})
+
+        for s in self.spans:
+            args = dict(s["args"], critical=id(s) in critical)
+            events.append({"name": s["name"], "cat": s["cat"], "ph": "X", "pid": 1, "tid": tids[s["tid"]],
+                           "ts": us(s["start"]), "dur": round((s["end"] - s["start"]) * 1e6, 1), "args": args})
+
+        # Fold consecutive samples into nested frame events so the stacks render as a flame chart
+        open_frames: Dict[int, List[Tuple[str, float]]] = {}
+        last_seen: Dict[int, float] = {}
+        for t, tid, stack in self.samples:
+            frames = open_frames.setdefault(tid, [])
+            common = 0
+            while common < len(frames) and common < len(stack) and frames[common][0] == stack[common]:
+                common += 1
+            for name, start in reversed(frames[common:]):
+                events.append({"name": name, "cat": "sample", "ph": "X", "pid": 2, "tid": tids[tid],
+                               "ts": us(start), "dur": round((t - start) * 1e6, 1)})
+            del frames[common:]
+            frames.extend((name, t) for name in stack[common:])
+            last_seen[tid] = t
+        for tid, frames in open_frames.items():
+            end = last_seen[tid] + self.interval
+            for name, start in reversed(frames):
+                events.append({"name": name, "cat": "sample", "ph": "X", "pid": 2, "tid": tids[tid],
+                               "ts": us(start), "dur": round((end - start) * 1e6, 1)})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"label": self.label, "summary": self.summary()}}
+
+    def save(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        name = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{self.id}.json"
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+        return name
@@ -0,0 +1,110 @@
+"""Cache tier shared by all web workers on a host.
+
+Each gunicorn worker is a separate process, so in-process state (query
+history, LLM responses) is otherwise invisible to its siblings. With
+SHARED_CACHE_PATH set, that state lives in one SQLite database instead; put
+it on /dev/shm (the gunicorn.conf.py default) to keep it in shared memory.
+Values are JSON; keyed entries expire after their TTL and lists are capped.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+PRUNE_EVERY = 200
+
+
+class SharedCache:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache_entries (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        expires REAL NOT NULL,
+        PRIMARY KEY (namespace, key)
+    );
+    CREATE TABLE IF NOT EXISTS cache_lists (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        value TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_cache_lists_name ON cache_lists (name, id);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Connections are per thread and per process: one opened before a fork is never reused
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._conn().execute("SELECT value FROM cache_entries WHERE namespace = ? AND key = ? AND expires > ?",
+                                   (namespace, key, time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float):
+        self._conn().execute("INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                             (namespace, key, json.dumps(value), time.time() + ttl))
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self._conn().execute("DELETE FROM cache_entries WHERE expires <= ?", (time.time(),))
+
+    def delete(self, namespace: str, key: str):
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def push(self, name: str, value: Any, limit: int):
+        """Append to a list, keeping only its newest limit items"""
+        conn = self._conn()
+        conn.execute("INSERT INTO cache_lists (name, value) VALUES (?, ?)", (name, json.dumps(value)))
+        conn.execute("DELETE FROM cache_lists WHERE name = ? AND id NOT IN "
+                     "(SELECT id FROM cache_lists WHERE name = ? ORDER BY id DESC LIMIT ?)", (name, name, limit))
+
+    def items(self, name: str) -> List[Any]:
+        rows = self._conn().execute("SELECT value FROM cache_lists WHERE name = ? ORDER BY id", (name,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def clear(self, name: str):
+        self._conn().execute("DELETE FROM cache_lists WHERE name = ?", (name,))
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        return {
+            "path": self.path,
+            "entries": conn.execute("SELECT COUNT(*) FROM cache_entries WHERE expires > ?", (time.time(),)).fetchone()[0],
+            "hits": self.hits,  # This worker only
+            "misses": self.misses,
+        }
+
+
+_cache: Optional[SharedCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """Cache configured by SHARED_CACHE_PATH, or None to keep state in-process"""
+    global _cache
+    path = os.getenv("SHARED_CACHE_PATH")
+    if not path:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SharedCache(path)
+        return _cache
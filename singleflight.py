@@ -0,0 +1,172 @@
+"""Single-flight coalescing for identical in-flight work.
+
+Callers that ask for the same key while a call is already running wait for
+that call and share its result instead of repeating it. Within a process this
+is done with threading events; when a lock directory is configured the same
+key is also coalesced across processes (e.g. gunicorn workers on one host)
+through per-key flock files, with the leader's result handed over as JSON.
+Waiting for another process's lock polls with sleep rather than a blocking
+flock, so under gevent only the waiting greenlet is suspended, not the worker.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # No flock (Windows): coalesce within the process only
+    fcntl = None
+
+RESULT_RETENTION_SECONDS = 60
+PRUNE_EVERY = 100
+LOCK_POLL_MAX_SECONDS = 0.2
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form used to match identical queries"""
+    return " ".join(query.lower().split())
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, name: str, lock_dir: Optional[str] = None):
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._leader_runs = 0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn once per in-flight key; returns (value, shared) where shared means another caller ran it"""
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        with self._lock:
+            call = self._calls.get(digest)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[digest] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value, shared = self._run_leader(digest, fn)
+            return call.value, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(digest, None)
+            call.done.set()
+
+    def _run_leader(self, digest: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        if not self.lock_dir:
+            return fn(), False
+
+        base = os.path.join(self.lock_dir, f"{self.name}-{digest}")
+        wait_start = time.time()
+        fd, waited = self._lock_file(base + ".lock")
+        try:
+            if waited:
+                # Another worker ran this key while we waited: take its result
+                found, value = self._read_result(base, wait_start)
+                if found:
+                    return value, True
+
+            value = fn()
+            self._write_result(base, value)
+            return value, False
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _lock_file(self, path: str) -> Tuple[int, bool]:
+        """Open and lock path; returns (fd, waited) where waited means another process held it"""
+        waited = False
+        while True:
+            fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+            # A blocking flock is not cooperative under gevent and would stall every greenlet in the worker
+            poll = 0.005
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    waited = True
+                    time.sleep(poll)
+                    poll = min(poll * 2, LOCK_POLL_MAX_SECONDS)
+            # _prune may have unlinked the file before we locked it; a lock on an orphan excludes no one
+            try:
+                if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                    return fd, waited
+            except FileNotFoundError:
+                pass
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _read_result(self, base: str, not_before: float) -> Tuple[bool, Any]:
+        try:
+            with open(base + ".json", "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return False, None
+        if entry.get("ts", 0) < not_before:
+            return False, None
+        return True, entry.get("value")
+
+    def _write_result(self, base: str, value: Any):
+        try:
+            payload = json.dumps({"ts": time.time(), "value": value})
+        except (TypeError, ValueError):
+            return  # Not shareable across processes; waiting workers will run it themselves
+        tmp = f"{base}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp, base + ".json")
+
+        self._leader_runs += 1
+        if self._leader_runs % PRUNE_EVERY == 0:
+            self._prune()
+
+    def _prune(self):
+        """Remove stale results, and lock files no one holds (their mtime says nothing about use)"""
+        cutoff = time.time() - RESULT_RETENTION_SECONDS
+        for name in os.listdir(self.lock_dir):
+            if not name.startswith(self.name + "-"):
+                continue
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                if not name.endswith(".lock"):
+                    os.remove(path)
+                    continue
+                fd = os.open(path, os.O_RDWR)
+            except OSError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(path)  # Unlinked while locked; see the inode check in _lock_file
+            except OSError:
+                pass  # Held by a running leader
+            finally:
+                os.close(fd)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,79 @@
+import time
+import threading
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+class Server:
+    """One busy slot, then queued requests that record the order they are admitted in"""
+
+    def __init__(self, **limits):
+        self.controller = AdmissionController(max_concurrent=1, **limits)
+        self.order, self.threads = [], []
+        self._busy = self.controller.admit("busy")
+        self._busy.__enter__()
+
+    def enqueue(self, client_id, priority="normal", label=None):
+        depth = self.controller.stats()["queue_depth"]
+
+        def request():
+            with self.controller.admit(client_id, priority):
+                self.order.append(label or client_id)
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        self.threads.append(thread)
+        while self.controller.stats()["queue_depth"] == depth:
+            time.sleep(0.001)
+
+    def drain(self):
+        self._busy.__exit__(None, None, None)
+        for thread in self.threads:
+            thread.join()
+        return self.order
+
+
+def test_clients_are_served_round_robin_within_a_class():
+    server = Server()
+    for label in ("a1", "a2", "a3"):
+        server.enqueue("a", label=label)
+    server.enqueue("b", label="b1")
+    server.enqueue("c", label="c1")
+    assert server.drain() == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_higher_priority_classes_are_served_first():
+    server = Server()
+    server.enqueue("a", "low")
+    server.enqueue("b", "normal")
+    server.enqueue("c", "high")
+    server.enqueue("d", "bogus")  # Unknown classes count as normal
+    assert server.drain() == ["c", "b", "d", "a"]
+
+
+def test_full_queue_and_full_client_share_are_rejected():
+    server = Server(max_queue=3, max_per_client=2)
+    server.enqueue("a")
+    server.enqueue("a")
+    with pytest.raises(AdmissionRejected, match="too many queued requests"):
+        with server.controller.admit("a"):
+            pass
+    server.enqueue("b")
+    with pytest.raises(AdmissionRejected, match="queue full") as rejected:
+        with server.controller.admit("c"):
+            pass
+    assert rejected.value.retry_after >= 1
+    server.drain()
+    assert server.controller.stats()["rejected"] == 2
+
+
+def test_waiting_past_the_queue_timeout_is_rejected():
+    server = Server(queue_timeout=0.05)
+    with pytest.raises(AdmissionRejected, match="timed out"):
+        with server.controller.admit("a"):
+            pass
+    stats = server.controller.stats()
+    assert (stats["timeouts"], stats["queue_depth"]) == (1, 0)
+    server.drain()
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+from dedup import SubtaskDeduplicator
+
+
+def make_state(query):
+    return SimpleNamespace(user_query=query, dedup_audit=[])
+
+
+def make_task(description="Research and analyze the request", agent_type="research_agent"):
+    return SimpleNamespace(id="task_1", description=description, agent_type=agent_type,
+                           result="", sources=[], retries=0, attempts=1)
+
+
+def completed(state, dedup, result):
+    task = make_task()
+    task.result, task.sources = result, [f"source for {state.user_query}"]
+    dedup.remember(state, task)
+
+
+def test_identical_subtasks_of_different_queries_do_not_share_results():
+    dedup = SubtaskDeduplicator()
+    completed(make_state("Compare Postgres and MySQL for analytics"), dedup, "postgres findings")
+
+    other = make_state("Plan a two week trip to Japan")
+    task = make_task()
+    assert dedup.reuse(other, task) is False
+    assert task.result == "" and other.dedup_audit == []
+
+
+def test_same_query_reuses_its_stored_result():
+    dedup = SubtaskDeduplicator()
+    completed(make_state("Compare Postgres and MySQL for analytics"), dedup, "postgres findings")
+
+    again = make_state("compare postgres and mysql for analytics!")
+    task = make_task()
+    assert dedup.reuse(again, task) is True
+    assert task.result == "postgres findings"
+    assert again.dedup_audit[0]["from_query"] == "Compare Postgres and MySQL for analytics"
+
+
+def test_results_of_different_queries_are_stored_separately():
+    dedup = SubtaskDeduplicator()
+    first, second = make_state("Compare Postgres and MySQL"), make_state("Plan a trip to Japan")
+    completed(first, dedup, "postgres findings")
+    completed(second, dedup, "japan findings")
+    dedup.forget(second, make_task())
+
+    assert dedup.stats()["stored"] == 1
+    assert dedup.lookup(make_task(), first.user_query)[0]["result"] == "postgres findings"
+    assert dedup.lookup(make_task(), second.user_query) is None
+
+
+LONG_QUERY = ("Compare the architecture, replication, indexing and operational cost of Postgres and MySQL "
+              "for a large analytics workload, then recommend one and design a migration plan")
+
+
+def plan(dedup, state, tasks):
+    state.subtasks, state.task_order = {}, []
+    for description, agent_type in tasks:
+        if dedup.merge_duplicate(state, description, agent_type, "plan"):
+            continue
+        task_id = f"task_{len(state.subtasks) + 1}"
+        state.subtasks[task_id] = SimpleNamespace(description=description, agent_type=agent_type)
+        state.task_order.append(task_id)
+    return state.task_order
+
+
+def test_fallback_plan_for_a_long_query_keeps_all_its_steps():
+    state = make_state(LONG_QUERY)
+    fallback = [(f"Research and gather information about: {LONG_QUERY}", "research_agent"),
+                (f"Analyze and process data for: {LONG_QUERY}", "analysis_agent"),
+                (f"Generate comprehensive output for: {LONG_QUERY}", "creative_agent")]
+    assert len(plan(SubtaskDeduplicator(), state, fallback)) == 3
+    assert state.dedup_audit == []
+
+
+def test_restated_subtasks_of_the_same_agent_type_are_merged():
+    state = make_state(LONG_QUERY)
+    tasks = [("Research Postgres replication", "research_agent"),
+             ("Follow-up for Research Postgres replication", "research_agent"),
+             ("Research Postgres replication", "analysis_agent")]
+    assert plan(SubtaskDeduplicator(), state, tasks) == ["task_1", "task_2"]
+    assert state.dedup_audit[0]["into"] == "task_1"
@@ -0,0 +1,24 @@
+import pytest
+
+from document_index import DocumentIndex, np
+
+
+def _write(directory, name, text):
+    (directory / name).write_text(text, encoding="utf-8")
+
+
+@pytest.mark.parametrize("dense", [False, pytest.param(True, marks=pytest.mark.skipif(np is None, reason="needs numpy"))])
+def test_removed_documents_are_never_returned(tmp_path, dense):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    _write(corpus, "a.txt", "alpha beta gamma")
+    _write(corpus, "b.txt", "alpha delta")
+    _write(corpus, "c.txt", "alpha secret removed content")
+    index_dir = str(tmp_path / "index")
+    DocumentIndex(index_dir, dense=dense).ingest(str(corpus))
+
+    (corpus / "c.txt").unlink()
+    DocumentIndex(index_dir, dense=dense).ingest(str(corpus))
+
+    sources = {p.source for p in DocumentIndex(index_dir).search("alpha secret", k=5)}
+    assert sources == {"a.txt", "b.txt"}
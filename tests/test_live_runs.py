@@ -0,0 +1,59 @@
+import pytest
+
+import shared_cache
+from aggregator import LiveRuns
+
+
+@pytest.fixture(params=["local", "shared"])
+def live_runs(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, "_cache", None)
+    if request.param == "shared":
+        monkeypatch.setenv("SHARED_CACHE_PATH", str(tmp_path / "cache.db"))
+    else:
+        monkeypatch.delenv("SHARED_CACHE_PATH", raising=False)
+    return LiveRuns()
+
+
+def test_joined_requests_follow_the_leader_under_their_own_run_id(live_runs):
+    for run_id in ("r0", "r2"):
+        live_runs.watch(run_id, "query-key")
+    live_runs.start("r1", "query", group="query-key")
+    live_runs.update("r1", "partial summary", 1, 3)
+
+    joined = live_runs.get("r0")
+    assert joined["run_id"] == "r0" and joined["leader_run_id"] == "r1"
+    assert joined["summary"] == "partial summary" and joined["completed"] == 1
+    assert live_runs.get("r1")["run_id"] == "r1"
+    assert live_runs.get("unknown") is None
+
+
+def test_a_waiting_request_does_not_show_an_earlier_finished_run_of_the_same_query(live_runs):
+    live_runs.start("old", "query", group="query-key")
+    live_runs.update("old", "old summary", 3, 3)
+    live_runs.finish("old", "completed")
+
+    live_runs.watch("new", "query-key")
+    waiting = live_runs.get("new")
+    assert waiting["queued"] is True and waiting["summary"] == "" and not waiting["done"]
+
+    live_runs.forget("new")
+    assert live_runs.get("new") is None
+
+
+def test_a_joined_request_keeps_following_its_leader_after_it_finishes(live_runs):
+    live_runs.watch("r0", "query-key")
+    live_runs.start("r1", "query", group="query-key")
+    live_runs.finish("r1", "completed")
+    assert live_runs.get("r0")["done"] is True
+
+    live_runs.watch("r0", "query-key", leader="r1")
+    live_runs.start("r2", "query", group="query-key")
+    assert live_runs.get("r0")["leader_run_id"] == "r1"
+
+
+def test_runs_are_visible_to_other_workers_through_the_shared_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, "_cache", None)
+    monkeypatch.setenv("SHARED_CACHE_PATH", str(tmp_path / "cache.db"))
+    LiveRuns().start("r1", "query")
+    LiveRuns().finish("r1", "completed")
+    assert LiveRuns().get("r1")["done"] is True
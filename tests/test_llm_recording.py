@@ -0,0 +1,16 @@
+from llm_recording import InteractionRecorder, ReplayBackend, load_log
+
+
+def test_cache_and_coalesced_hits_are_recorded_but_do_not_set_the_replay_latency(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    recorder = InteractionRecorder(path)
+    recorder.record("prompt", "answer", 0.4)
+    recorder.record("prompt", "answer", 0.001, cached=True)
+    recorder.record("prompt", "answer", 0.2, coalesced=True)
+    recorder.close()
+
+    entries = load_log(path)
+    assert [(entry["cached"], entry["coalesced"]) for entry in entries] == [(False, False), (True, False), (False, True)]
+    replay = ReplayBackend(path, time_scale=0)
+    assert replay.miss_latency == 0.4
+    assert [replay.generate("prompt") for _ in range(3)] == ["answer"] * 3
@@ -0,0 +1,66 @@
+import pytest
+
+from plan_sizing import MAX_SUBTASKS, MIN_SUBTASKS, choose_plan_size, is_trivial
+
+TRIVIAL = [
+    "What is the capital of France?",
+    "Who wrote Pride and Prejudice?",
+    "When did World War II end?",
+    "How many bytes are in a kilobyte?",
+    "what is 2 + 2",
+    "Define entropy",
+    "Tell me a joke",
+    "Translate hello into French",
+]
+
+NEEDS_PLAN = [
+    "Write a blog post about climate change impacts on agriculture in Africa",
+    "Explain how transformers work in deep learning and give examples",
+    "Help me learn machine learning in 3 months",
+    "Build a REST API in Flask with authentication, rate limiting and tests",
+    "What are the pros and cons of Postgres versus MySQL for analytics?",
+    "What is Kubernetes? How should a small team adopt it?",
+    "Summarize the history of the Roman Empire, its economy, its army and why it declined",
+    "Build a website",
+    "Create a marketing plan",
+]
+
+
+@pytest.mark.parametrize("query", TRIVIAL)
+def test_trivial_questions_take_the_fast_path(query):
+    assert is_trivial(query)
+    assert choose_plan_size(query).fast_path
+
+
+@pytest.mark.parametrize("query", NEEDS_PLAN)
+def test_requests_for_work_get_a_full_plan(query):
+    size = choose_plan_size(query)
+    assert not is_trivial(query)
+    assert not size.fast_path
+    assert MIN_SUBTASKS <= size.subtasks <= MAX_SUBTASKS
+
+
+def test_plan_size_grows_with_complexity():
+    simple = choose_plan_size("Write a blog post about climate change impacts on agriculture in Africa")
+    complex_ = choose_plan_size("Research, compare and evaluate cloud providers, design a migration plan "
+                                "and a rollout strategy, then analyze costs and risks step by step")
+    assert simple.subtasks == MIN_SUBTASKS
+    assert complex_.subtasks == MAX_SUBTASKS
+
+
+def test_latency_budget_too_small_for_a_plan_falls_back_to_the_fast_path():
+    size = choose_plan_size("Build a REST API in Flask with authentication, rate limiting and tests", latency_budget=0.5)
+    assert size.fast_path
+
+
+def test_latency_budget_caps_a_sequential_plan_at_its_capacity():
+    query = "Build a REST API in Flask with authentication, rate limiting and tests"
+    size = choose_plan_size(query, latency_budget=7, concurrent=False)
+    assert (size.subtasks, size.max_parallelism) == (1, 1)
+    assert choose_plan_size(query, concurrent=False).max_parallelism == 1
+
+
+def test_latency_budget_spreads_a_plan_over_a_concurrent_executor():
+    size = choose_plan_size("Build a REST API in Flask with authentication, rate limiting and tests",
+                            latency_budget=7, concurrent=True)
+    assert size.subtasks > 1 and size.max_parallelism == size.subtasks
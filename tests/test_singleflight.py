@@ -0,0 +1,87 @@
+import time
+import hashlib
+import threading
+import multiprocessing
+
+import pytest
+
+import singleflight
+from singleflight import SingleFlight
+
+
+def run_together(flight, key, fn, callers):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_followers_share_the_leaders_result():
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "answer"
+
+    results, errors = run_together(SingleFlight("test"), "key", slow, 5)
+    assert not errors and len(calls) == 1
+    assert sorted(results) == [("answer", False)] + [("answer", True)] * 4
+
+
+def test_the_leaders_error_is_raised_in_every_follower():
+    def broken():
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    flight = SingleFlight("test")
+    results, errors = run_together(flight, "key", broken, 4)
+    assert not results and len(errors) == 4
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert flight.in_flight() == 0
+
+
+def _lead_in_other_process(lock_dir, started):
+    def slow():
+        started.set()
+        time.sleep(0.5)
+        return {"summary": "from the other worker"}
+    SingleFlight("test", lock_dir).do("key", slow)
+
+
+@pytest.mark.skipif(singleflight.fcntl is None, reason="needs flock")
+def test_result_is_handed_over_across_processes(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    started = ctx.Event()
+    other = ctx.Process(target=_lead_in_other_process, args=(str(tmp_path), started))
+    other.start()
+    assert started.wait(5)
+    value, shared = SingleFlight("test", str(tmp_path)).do("key", lambda: {"summary": "ran again"})
+    other.join()
+    assert (value, shared) == ({"summary": "from the other worker"}, True)
+
+
+@pytest.mark.skipif(singleflight.fcntl is None, reason="needs flock")
+def test_prune_keeps_the_lock_of_a_running_leader_however_old(tmp_path, monkeypatch):
+    monkeypatch.setattr(singleflight, "RESULT_RETENTION_SECONDS", 0)
+    flight = SingleFlight("test", str(tmp_path))
+    path = lambda key, ext: tmp_path / f"test-{hashlib.sha256(key.encode()).hexdigest()}.{ext}"
+    flight.do("finished", lambda: "done")
+
+    def long_running():
+        time.sleep(0.01)
+        flight._prune()
+        return path("running", "lock").exists()
+
+    assert flight.do("running", long_running) == (True, False)
+    assert not path("finished", "lock").exists() and not path("finished", "json").exists()
@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import worker
+from work_queue import DONE, FAILED, LEASED, SQLiteWorkQueue, WorkQueue
+from worker import Worker
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class PublishOnly(WorkQueue):
+        def publish(self, payload, max_attempts=3):
+            return "id"
+
+    with pytest.raises(TypeError):
+        PublishOnly()
+
+
+def test_worker_purges_finished_items_past_retention(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.db"))
+    old = queue.publish({"kind": "sleep", "seconds": 0})
+    Worker(queue, idle_exit=0.1, retention=0).run()
+    assert queue.get(old).status == DONE
+
+    time.sleep(0.3)
+    Worker(queue, idle_exit=0.1, retention=0.2).run()
+    assert queue.get(old) is None
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteWorkQueue(str(tmp_path / "queue.db"))
+
+
+def test_claim_leases_the_oldest_pending_item_once(queue):
+    first = queue.publish({"kind": "sleep"})
+    second = queue.publish({"kind": "sleep"})
+    assert queue.claim("w1", 30).id == first
+    assert queue.claim("w2", 30).id == second
+    assert queue.claim("w3", 30) is None
+    assert queue.stats()[LEASED] == 2
+
+
+def test_expired_lease_is_reclaimed_and_the_old_owner_cannot_complete(queue):
+    item_id = queue.publish({"kind": "sleep"})
+    lost = queue.claim("w1", 0.05)
+    time.sleep(0.1)
+
+    reclaimed = queue.claim("w2", 30)
+    assert (reclaimed.id, reclaimed.attempts) == (item_id, 2)
+    assert queue.heartbeat(item_id, "w1", 30) is False
+    assert queue.complete(lost.id, "w1", "late result") is False
+    assert queue.complete(item_id, "w2", "result") is True
+    assert (queue.get(item_id).status, queue.get(item_id).result) == (DONE, "result")
+
+
+def test_lease_expiry_on_the_last_attempt_fails_the_item(queue):
+    item_id = queue.publish({"kind": "sleep"}, max_attempts=1)
+    queue.claim("w1", 0.05)
+    time.sleep(0.1)
+    assert queue.claim("w2", 30) is None
+    assert queue.get(item_id).status == FAILED
+
+
+def test_worker_errors_retry_the_item_until_it_fails(queue):
+    item_id = queue.publish({"kind": "unknown"}, max_attempts=2)
+    runner = Worker(queue, idle_exit=0.1, retention=0)
+    runner.run()
+    item = queue.get(item_id)
+    assert (item.status, item.attempts, runner.failed) == (FAILED, 2, 2)
+    assert "Unknown work item kind" in item.error
+
+
+def test_worker_without_an_api_client_fails_llm_items(queue, monkeypatch):
+    monkeypatch.setattr(worker, "_gemini", SimpleNamespace(available=False))
+    item_id = queue.publish({"kind": "tool_agent", "prompt": "Execute this task"}, max_attempts=1)
+    Worker(queue, idle_exit=0.1, retention=0).run()
+    item = queue.get(item_id)
+    assert item.status == FAILED and "not configured" in item.error
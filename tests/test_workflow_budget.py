@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Dict, List
+
+import pytest
+
+from workflow_budget import (COST_BUDGET, LLM_CALL_BUDGET, NO_PROGRESS, TIMEOUT, BudgetController)
+
+
+class Status(Enum):
+    PENDING = "pending"
+    COMPLETED = "completed"
+
+
+@dataclass
+class Task:
+    status: Status = Status.PENDING
+    description: str = "Research the request"
+    result: str = ""
+
+
+@dataclass
+class State:
+    subtasks: Dict[str, Task] = field(default_factory=dict)
+    feedback_queue: List = field(default_factory=list)
+    last_progress_signature: str = ""
+    stalled_iterations: int = 0
+    stop_reason: str = ""
+    llm_calls: int = 0
+    llm_cost: float = 0.0
+    cost_budget: float = 0.0
+    deadline: float = 0.0
+
+
+class Client:
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, prompt):
+        self.prompts.append(prompt)
+        return "x" * 400
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    monkeypatch.setenv("WORKFLOW_MAX_LLM_CALLS", "2")
+    monkeypatch.setenv("LLM_COST_PER_1K_INPUT_TOKENS", "1")
+    monkeypatch.setenv("LLM_COST_PER_1K_OUTPUT_TOKENS", "1")
+    return BudgetController()
+
+
+def test_an_iteration_that_changes_nothing_stops_the_run(budget):
+    state = State(subtasks={"task_1": Task()})
+    assert budget.check_progress(state)
+    state.subtasks["task_1"].status, state.subtasks["task_1"].result = Status.COMPLETED, "done"
+    assert budget.check_progress(state)
+    assert not budget.check_progress(state)
+    assert state.stop_reason == NO_PROGRESS
+
+
+def test_llm_call_cap_refuses_further_calls(budget):
+    state, client = State(), Client()
+    assert budget.generate(state, client, "one") and budget.generate(state, client, "two")
+    assert budget.generate(state, client, "three") is None
+    assert (state.stop_reason, state.llm_calls, len(client.prompts)) == (LLM_CALL_BUDGET, 2, 2)
+
+
+def test_cost_budget_stops_the_run_once_spent(budget):
+    state, client = State(cost_budget=0.05), Client()
+    budget.generate(state, client, "x" * 100)
+    assert state.llm_cost == pytest.approx(0.125)
+    assert budget.generate(state, client, "again") is None
+    assert state.stop_reason == COST_BUDGET
+
+
+def test_deadline_stops_the_run_and_the_first_reason_is_kept(budget):
+    state = State(deadline=1.0)
+    assert not budget.has_budget(state)
+    assert budget.generate(state, Client(), "late") is None
+    budget.stop(state, NO_PROGRESS)
+    assert state.stop_reason == TIMEOUT
@@ -0,0 +1,270 @@
+"""Subtask work queue shared between the workflow and standalone workers.
+
+With WORK_QUEUE_URL set, ToolAgent publishes each execution as a work item
+instead of calling the LLM itself, and prefetches upcoming pending subtasks so
+several workers run them in parallel. Workers (see worker.py) claim items
+under a lease, renew it while they run and report the result back; items
+whose lease expires are handed to another worker until max_attempts is used.
+
+The default backend is SQLite (sqlite:///path/to/queue.db), which works across
+processes on one host or over a shared filesystem that supports locking.
+Other backends register a factory with register_backend().
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class WorkItem:
+    id: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    max_attempts: int
+    result: Optional[str] = None
+    error: Optional[str] = None
+
+
+class WorkQueue(ABC):
+    """Interface every backend implements"""
+
+    @abstractmethod
+    def publish(self, payload: Dict[str, Any], max_attempts: int = 3) -> str:
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[WorkItem]:
+        """Lease the oldest pending item, first returning expired leases to the queue"""
+        ...
+
+    @abstractmethod
+    def heartbeat(self, item_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Extend a lease; False means the lease was lost and the result will be ignored"""
+        ...
+
+    @abstractmethod
+    def complete(self, item_id: str, worker_id: str, result: str) -> bool:
+        ...
+
+    @abstractmethod
+    def fail(self, item_id: str, worker_id: str, error: str) -> None:
+        """Record a failed attempt; the item is retried until max_attempts"""
+        ...
+
+    @abstractmethod
+    def get(self, item_id: str) -> Optional[WorkItem]:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    def purge(self, older_than: float) -> int:
+        """Delete finished items last updated more than older_than seconds ago"""
+        ...
+
+    def wait(self, item_id: str, timeout: float, poll: float = 0.05) -> Optional[WorkItem]:
+        """Block until the item is done or failed; None on timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            item = self.get(item_id)
+            if item is None or item.status in (DONE, FAILED):
+                return item
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+            poll = min(poll * 1.5, 0.5)
+
+
+class SQLiteWorkQueue(WorkQueue):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS work_items (
+        id TEXT PRIMARY KEY,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        lease_owner TEXT,
+        lease_expires REAL,
+        result TEXT,
+        error TEXT,
+        created REAL NOT NULL,
+        updated REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_work_items_status ON work_items (status, created);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def publish(self, payload: Dict[str, Any], max_attempts: int = 3) -> str:
+        item_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO work_items (id, payload, status, max_attempts, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (item_id, json.dumps(payload), PENDING, max_attempts, now, now))
+        return item_id
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[WorkItem]:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE work_items SET status = ?, lease_owner = NULL, updated = ? "
+                         "WHERE status = ? AND lease_expires < ? AND attempts < max_attempts",
+                         (PENDING, now, LEASED, now))
+            conn.execute("UPDATE work_items SET status = ?, error = 'lease expired', updated = ? "
+                         "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                         (FAILED, now, LEASED, now))
+            row = conn.execute("SELECT id, payload, attempts, max_attempts FROM work_items "
+                               "WHERE status = ? ORDER BY created LIMIT 1", (PENDING,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE work_items SET status = ?, lease_owner = ?, lease_expires = ?, "
+                         "attempts = attempts + 1, updated = ? WHERE id = ?",
+                         (LEASED, worker_id, now + lease_seconds, now, row[0]))
+        return WorkItem(id=row[0], payload=json.loads(row[1]), status=LEASED,
+                        attempts=row[2] + 1, max_attempts=row[3])
+
+    def heartbeat(self, item_id: str, worker_id: str, lease_seconds: float) -> bool:
+        cur = self._conn().execute(
+            "UPDATE work_items SET lease_expires = ?, updated = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+            (time.time() + lease_seconds, time.time(), item_id, LEASED, worker_id))
+        return cur.rowcount == 1
+
+    def complete(self, item_id: str, worker_id: str, result: str) -> bool:
+        cur = self._conn().execute(
+            "UPDATE work_items SET status = ?, result = ?, lease_owner = NULL, updated = ? "
+            "WHERE id = ? AND status = ? AND lease_owner = ?",
+            (DONE, result, time.time(), item_id, LEASED, worker_id))
+        return cur.rowcount == 1
+
+    def fail(self, item_id: str, worker_id: str, error: str) -> None:
+        self._conn().execute(
+            "UPDATE work_items SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+            "error = ?, lease_owner = NULL, updated = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+            (PENDING, FAILED, error, time.time(), item_id, LEASED, worker_id))
+
+    def get(self, item_id: str) -> Optional[WorkItem]:
+        row = self._conn().execute(
+            "SELECT id, payload, status, attempts, max_attempts, result, error FROM work_items WHERE id = ?",
+            (item_id,)).fetchone()
+        if row is None:
+            return None
+        return WorkItem(id=row[0], payload=json.loads(row[1]), status=row[2], attempts=row[3],
+                        max_attempts=row[4], result=row[5], error=row[6])
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM work_items GROUP BY status").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished items last updated more than older_than seconds ago"""
+        cur = self._conn().execute("DELETE FROM work_items WHERE status IN (?, ?) AND updated < ?",
+                                   (DONE, FAILED, time.time() - older_than))
+        return cur.rowcount
+
+
+_BACKENDS: Dict[str, Callable[[str], WorkQueue]] = {"sqlite": SQLiteWorkQueue}
+
+
+def register_backend(scheme: str, factory: Callable[[str], WorkQueue]):
+    """Make WORK_QUEUE_URL=<scheme>://<location> resolve to factory(<location>)"""
+    _BACKENDS[scheme] = factory
+
+
+def open_queue(url: str) -> WorkQueue:
+    scheme, sep, location = url.partition("://")
+    if not sep or scheme not in _BACKENDS:
+        raise ValueError(f"Unsupported work queue URL: {url}")
+    if scheme == "sqlite":
+        location = location[1:] if location.startswith("/") else location  # sqlite:///rel.db, sqlite:////abs.db
+    return _BACKENDS[scheme](location)
+
+
+_queue: Optional[WorkQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_work_queue() -> Optional[WorkQueue]:
+    """Queue configured by WORK_QUEUE_URL, or None to execute subtasks in-process"""
+    global _queue
+    url = os.getenv("WORK_QUEUE_URL")
+    if not url:
+        return None
+    with _queue_lock:
+        if _queue is None:
+            _queue = open_queue(url)
+        return _queue
+
+
+def _prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def submit(queue: WorkQueue, state, task, prompt: str) -> str:
+    """Publish a ToolAgent execution unless the same prompt is already queued for this task"""
+    queued = state.queued_items.get(task.id)
+    if queued and queued["prompt_hash"] == _prompt_hash(prompt):
+        return queued["item"]
+    item_id = queue.publish({"kind": "tool_agent", "task_id": task.id, "prompt": prompt},
+                            max_attempts=int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "3")))
+    state.queued_items[task.id] = {"item": item_id, "prompt_hash": _prompt_hash(prompt)}
+    return item_id
+
+
+def is_queued(state, task, prompt: str) -> bool:
+    queued = state.queued_items.get(task.id)
+    return bool(queued) and queued["prompt_hash"] == _prompt_hash(prompt)
+
+
+def collect(queue: WorkQueue, state, task_id: str) -> Optional[str]:
+    """Wait for a task's queued execution; None when it failed or timed out"""
+    queued = state.queued_items.pop(task_id, None)
+    if queued is None:
+        return None
+    item = queue.wait(queued["item"], timeout=float(os.getenv("WORK_QUEUE_RESULT_TIMEOUT", "300")))
+    if item is None:
+        print(f"⌛ Timed out waiting for a worker to run {task_id}")
+        return None
+    if item.status != DONE:
+        print(f"❌ Worker execution of {task_id} failed: {item.error}")
+        return None
+    return item.result
@@ -0,0 +1,154 @@
+"""Standalone worker that executes queued ToolAgent subtasks.
+
+Run one or more of these on any host that can reach the queue:
+    WORK_QUEUE_URL=sqlite:///work_queue.db python worker.py --concurrency 4
+
+Each worker thread claims an item under a lease, renews the lease while the
+LLM call runs and reports the result. A failed call (or a worker without an
+API key) fails the attempt; if a worker dies, its lease expires. Either way
+the item is retried, by any worker, until its max_attempts are used. Finished items (which hold the full
+prompt and result) are purged once they are older than the retention period.
+"""
+import os
+import time
+import uuid
+import signal
+import socket
+import argparse
+import threading
+from typing import Any, Dict, Optional
+
+from work_queue import WorkQueue, WorkItem, open_queue
+
+PURGE_INTERVAL_SECONDS = 60
+
+_gemini = None
+
+
+def _client():
+    # Imported lazily so benchmark workers never configure the API client
+    global _gemini
+    if _gemini is None:
+        from agentic_workflow import gemini
+        _gemini = gemini
+    return _gemini
+
+
+def execute(payload: Dict[str, Any]) -> str:
+    kind = payload.get("kind")
+    if kind == "tool_agent":
+        client = _client()
+        if not client.available:
+            raise RuntimeError("Gemini API is not configured on this worker (set GOOGLE_API_KEY)")
+        # Unlike generate(), this raises on API errors, so the item is retried and can fail
+        return client._call_model(payload["prompt"])
+    if kind == "sleep":  # Synthetic work used by benchmarks/bench_work_queue.py
+        time.sleep(float(payload.get("seconds", 0)))
+        return "ok"
+    raise ValueError(f"Unknown work item kind: {kind}")
+
+
+class Worker:
+    def __init__(self, queue: WorkQueue, concurrency: int = 1, lease_seconds: float = 60.0,
+                 idle_exit: Optional[float] = None, retention: float = 3600.0):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.idle_exit = idle_exit
+        self.retention = retention  # 0 keeps finished items forever
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.stop_event = threading.Event()
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def run(self):
+        threads = [threading.Thread(target=self._loop, name=f"worker-{i}", daemon=True)
+                   for i in range(self.concurrency)]
+        for t in threads:
+            t.start()
+        janitor = threading.Thread(target=self._purge_loop, name="worker-purge", daemon=True)
+        janitor.start()
+        for t in threads:
+            t.join()
+        self.stop_event.set()
+        janitor.join()
+
+    def _purge_loop(self):
+        """Delete finished items past the retention period so the queue does not grow without bound"""
+        if not self.retention:
+            return
+        while True:
+            try:
+                purged = self.queue.purge(self.retention)
+                if purged:
+                    print(f"🧹 Purged {purged} finished work items")
+            except Exception as e:
+                print(f"❌ Work queue purge failed: {e}")
+            if self.stop_event.wait(min(PURGE_INTERVAL_SECONDS, self.retention)):
+                return
+
+    def _loop(self):
+        idle_since = time.monotonic()
+        backoff = 0.05
+        while not self.stop_event.is_set():
+            item = self.queue.claim(self.worker_id, self.lease_seconds)
+            if item is None:
+                if self.idle_exit is not None and time.monotonic() - idle_since > self.idle_exit:
+                    return
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, 1.0)
+                continue
+            backoff = 0.05
+            self._process(item)
+            idle_since = time.monotonic()
+
+    def _process(self, item: WorkItem):
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(self.lease_seconds / 3):
+                if not self.queue.heartbeat(item.id, self.worker_id, self.lease_seconds):
+                    return
+
+        heartbeat = threading.Thread(target=renew, daemon=True)
+        heartbeat.start()
+        try:
+            result = execute(item.payload)
+            ok = self.queue.complete(item.id, self.worker_id, result)
+        except Exception as e:
+            print(f"❌ Work item {item.id} failed (attempt {item.attempts}/{item.max_attempts}): {e}")
+            self.queue.fail(item.id, self.worker_id, str(e))
+            ok = False
+        finally:
+            done.set()
+            heartbeat.join()
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Execute queued ToolAgent subtasks")
+    parser.add_argument("--queue", default=os.getenv("WORK_QUEUE_URL", "sqlite:///work_queue.db"))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")))
+    parser.add_argument("--lease", type=float, default=float(os.getenv("WORK_QUEUE_LEASE_SECONDS", "60")))
+    parser.add_argument("--idle-exit", type=float, help="exit after this many idle seconds")
+    parser.add_argument("--retention", type=float, default=float(os.getenv("WORK_QUEUE_RETENTION_SECONDS", "3600")),
+                        help="seconds to keep finished items before purging them (0 keeps them)")
+    args = parser.parse_args()
+
+    worker = Worker(open_queue(args.queue), args.concurrency, args.lease, args.idle_exit, args.retention)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop_event.set())
+    print(f"👷 Worker {worker.worker_id} polling {args.queue} with {args.concurrency} threads")
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop_event.set()
+    print(f"✅ Worker stopped: {worker.completed} completed, {worker.failed} failed")
+
+
+if __name__ == "__main__":
+    main()
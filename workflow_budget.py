@@ -0,0 +1,113 @@
+"""Iteration and spend budget for a single workflow run.
+
+The graph can loop plan → plan or reflection → plan without changing anything.
+BudgetController fingerprints the workflow's progress each time the planner
+runs and stops the run once an iteration changes nothing. It also caps the
+number of LLM calls, their estimated cost and the wall-clock time per
+workflow. Whatever ends a run is recorded in WorkflowState.stop_reason.
+"""
+import os
+import time
+import hashlib
+from typing import Optional
+
+# Reasons a workflow stopped, reported in WorkflowState.stop_reason
+COMPLETED = "completed"
+FAST_PATH = "fast_path"
+INCOMPLETE = "incomplete"
+NO_PROGRESS = "no_progress"
+LLM_CALL_BUDGET = "llm_call_budget"
+COST_BUDGET = "cost_budget"
+MAX_ITERATIONS = "max_outer_iterations"
+TIMEOUT = "timeout"
+
+CHARS_PER_TOKEN = 4
+TYPICAL_PROMPT_CHARS = 2000
+TYPICAL_RESPONSE_CHARS = 1200
+
+
+class BudgetController:
+    def __init__(self):
+        self.max_llm_calls = int(os.getenv("WORKFLOW_MAX_LLM_CALLS", "40"))
+        self.max_cost = float(os.getenv("WORKFLOW_MAX_COST", "0"))  # 0 means no cost cap
+        self.max_stalled_iterations = int(os.getenv("WORKFLOW_MAX_STALLED_ITERATIONS", "1"))
+        self.input_price = float(os.getenv("LLM_COST_PER_1K_INPUT_TOKENS", "0"))
+        self.output_price = float(os.getenv("LLM_COST_PER_1K_OUTPUT_TOKENS", "0"))
+        # Running average used by the planner to turn a cost budget into a plan size
+        self.avg_call_cost = self.estimate_cost("x" * TYPICAL_PROMPT_CHARS, "x" * TYPICAL_RESPONSE_CHARS)
+
+    def progress_signature(self, state) -> str:
+        """Fingerprint of everything a planning iteration can change"""
+        h = hashlib.sha256()
+        for task_id in sorted(state.subtasks):
+            task = state.subtasks[task_id]
+            h.update(f"{task_id}|{task.status.value}|{task.description}|{task.result}\n".encode("utf-8"))
+        for feedback in state.feedback_queue:
+            h.update(f"fb|{feedback.task_id}|{feedback.feedback_type.value}|{feedback.message}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def check_progress(self, state) -> bool:
+        """Record this iteration's signature; False (and the run stopped) once nothing changes"""
+        signature = self.progress_signature(state)
+        if state.last_progress_signature and signature == state.last_progress_signature:
+            state.stalled_iterations += 1
+        else:
+            state.stalled_iterations = 0
+        state.last_progress_signature = signature
+        if state.stalled_iterations >= self.max_stalled_iterations:
+            self.stop(state, NO_PROGRESS)
+            return False
+        return True
+
+    def estimate_cost(self, prompt: str, response: str) -> float:
+        input_tokens = len(prompt) / CHARS_PER_TOKEN
+        output_tokens = len(response or "") / CHARS_PER_TOKEN
+        return input_tokens / 1000 * self.input_price + output_tokens / 1000 * self.output_price
+
+    def _exhausted(self, state) -> Optional[str]:
+        if state.deadline and time.time() >= state.deadline:
+            return TIMEOUT
+        if state.llm_calls >= self.max_llm_calls:
+            return LLM_CALL_BUDGET
+        max_cost = state.cost_budget or self.max_cost
+        if max_cost and state.llm_cost >= max_cost:
+            return COST_BUDGET
+        return None
+
+    def has_budget(self, state) -> bool:
+        return not state.stop_reason and self._exhausted(state) is None
+
+    def allow_call(self, state) -> bool:
+        if state.stop_reason:
+            return False
+        reason = self._exhausted(state)
+        if reason:
+            self.stop(state, reason)
+            return False
+        return True
+
+    def reserve(self, state, prompt: str) -> bool:
+        """Count an LLM call (and its input cost) before it runs, e.g. when it is queued for a worker"""
+        if not self.allow_call(state):
+            return False
+        state.llm_calls += 1
+        state.llm_cost += self.estimate_cost(prompt, "")
+        return True
+
+    def settle(self, state, prompt: str, response: str):
+        """Add the output cost once a reserved call has returned"""
+        state.llm_cost += self.estimate_cost("", response)
+        self.avg_call_cost += 0.1 * (self.estimate_cost(prompt, response) - self.avg_call_cost)
+
+    def generate(self, state, client, prompt: str) -> Optional[str]:
+        """Call the LLM if the workflow still has budget; None means the run has been stopped"""
+        if not self.reserve(state, prompt):
+            return None
+        response = client.generate(prompt)
+        self.settle(state, prompt, response)
+        return response
+
+    def stop(self, state, reason: str):
+        if not state.stop_reason:
+            state.stop_reason = reason
+            print(f"🛑 Stopping workflow: {reason}")